@@ -0,0 +1,400 @@
+"""
+Benchmarks of the parse, database and site stages of the build, run
+    on synthetic transcriptions shaped like the manuscript and scaled
+    up, so that slower stages show up before they slow a deploy down.
+    Each run builds into a temporary directory of its own, the results
+    are saved as JSON and may be compared to the results of an earlier run.
+    It can also check that the pages generated by several processes are
+    the same as the ones generated by one, for a transcription of two
+    transcribers whose words differ.
+"""
+import platform
+import sqlite3 as sql
+import sys
+from argparse import ArgumentParser
+from itertools import accumulate
+from json import load, dump
+from multiprocessing import get_context
+from os import chdir, cpu_count, scandir
+from os.path import abspath, join
+from pathlib import Path
+from random import Random
+from resource import getrusage, RUSAGE_SELF, RUSAGE_CHILDREN
+from shutil import copy, copytree
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Sequence, TextIO, Tuple
+from warnings import simplefilter
+
+syllables = ['qo', 'o', 'ch', 'sh', 'k', 't', 'p', 'f', 'e', 'ee', 'd', 'y', 'a', 'i', 'in', 'iin',
+             'r', 'l', 's', 'ol', 'or', 'al', 'ar', 'ai', 'dy', 'ckh', 'cth']
+
+
+class CorpusShape(NamedTuple):
+    """
+    Shape of a synthetic transcription, the lengths are averages.
+    """
+    folios: int
+    lines_per_folio: int
+    words_per_line: int
+    vocabulary: int
+
+
+manuscript_shape = CorpusShape(folios=257, lines_per_folio=20, words_per_line=7, vocabulary=8500)
+dimensions = {'folios': 'folios', 'line_length': 'words_per_line', 'vocabulary': 'vocabulary'}
+
+
+def scale_shape(shape: CorpusShape, scale: float, scaled: Iterable[str]) -> CorpusShape:
+    """
+    Scale some dimensions of a corpus shape.
+
+    :param shape: Shape to scale.
+    :param scale: Factor to scale the dimensions by.
+    :param scaled: Names of the dimensions to scale, keys of dimensions.
+    :return: The scaled shape.
+    """
+    return shape._replace(**{dimensions[name]: max(1, round(getattr(shape, dimensions[name]) * scale))
+                             for name in scaled})
+
+
+def folio_name(number: int) -> str:
+    """
+    Get the name of the nth folio page, f1r, f1v, f2r...
+
+    :param number: Number of the page, starting from 0.
+    :return: Name of the folio page.
+    """
+    return f"f{number // 2 + 1}{'rv'[number % 2]}"
+
+
+def generate_vocabulary(size: int, random: Random) -> List[str]:
+    """
+    Generate distinct words made of the syllables of the EVA alphabet.
+
+    :param size: Number of words.
+    :param random: Random number generator.
+    :return: The words.
+    """
+    words = set()
+    length = 1
+    while len(words) < size:
+        for _ in range(size * 4):  # Short words run out, so longer ones are tried next.
+            words.add(''.join(random.choices(syllables, k=random.randint(1, length))))
+            if len(words) == size:
+                break
+        length += 1
+    return sorted(words)
+
+
+def generate_corpus(file: TextIO, shape: CorpusShape, seed: int = 0, transcribers: Sequence[str] = ('H',)) -> None:
+    """
+    Write a synthetic transcription in the Interim Voynich Format, word
+        frequencies follow Zipf's law as they roughly do in the manuscript.
+
+    :param file: File to write the transcription to.
+    :param shape: Shape of the transcription.
+    :param seed: Seed of the random number generator, the same seed and
+        shape always give the same transcription.
+    :param transcribers: Codes of the transcribers of each line, the
+        lines of the ones after the first read some of the words as
+        other words of the vocabulary, mostly rare ones.
+    """
+    random = Random(seed)
+    misreadings = Random(seed + 1)  # Separate, so that the lines of the first transcriber do not depend on the others.
+    vocabulary = generate_vocabulary(shape.vocabulary, random)
+    random.shuffle(vocabulary)  # So that the frequent words are not the alphabetically first ones.
+    weights = list(accumulate(1 / rank for rank in range(1, len(vocabulary) + 1)))
+    file.write('# Synthetic transcription generated by benchmark.py\n')
+    for number in range(shape.folios):
+        name = folio_name(number)
+        file.write(f'<{name}>      <! $Q=A $P=A $L=A $H=1>\n')
+        for line in range(1, random.randint(shape.lines_per_folio // 2, shape.lines_per_folio * 3 // 2) + 1):
+            length = random.randint(max(1, shape.words_per_line // 2), shape.words_per_line * 3 // 2)
+            words = random.choices(vocabulary, cum_weights=weights, k=length)
+            file.write(f'<{name}.P.{line};{transcribers[0]}>      {".".join(words)}\n')
+            for transcriber in transcribers[1:]:
+                read = [misreadings.choice(vocabulary) if misreadings.random() < 0.1 else word for word in words]
+                file.write(f'<{name}.P.{line};{transcriber}>      {".".join(read)}\n')
+
+
+def timed(function: Callable, stage: str, timings: Dict[str, float]) -> Callable:
+    """
+    Wrap a function so that the time spent in it is added to its stage.
+
+    :param function: Function to time.
+    :param stage: Name of the stage.
+    :param timings: Stage -> seconds pairs, updated after each call.
+    :return: The wrapped function.
+    """
+    def wrapper(*args, **kwargs):
+        start = perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            timings[stage] = timings.get(stage, 0) + perf_counter() - start
+    return wrapper
+
+
+def timed_iterator(iterable: Iterable, stage: str, timings: Dict[str, float]) -> Iterator:
+    """
+    Wrap an iterable so that the time spent producing its items is added to its stage.
+
+    :param iterable: Iterable to time.
+    :param stage: Name of the stage.
+    :param timings: Stage -> seconds pairs, updated after each item.
+    :return: A generator of the items.
+    """
+    iterator = iter(iterable)
+    while True:
+        start = perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            timings[stage] = timings.get(stage, 0) + perf_counter() - start
+        yield item
+
+
+def list_files(directory: str) -> Dict[str, Tuple[int, int]]:
+    """
+    List the files under a directory.
+
+    :param directory: Directory to list.
+    :return: Path -> (size, modification time) pairs.
+    """
+    files = {}
+    for entry in scandir(directory):
+        if entry.is_dir(follow_symlinks=False):
+            files.update(list_files(entry.path))
+        else:
+            stat = entry.stat(follow_symlinks=False)
+            files[entry.path] = (stat.st_size, stat.st_mtime_ns)
+    return files
+
+
+def max_rss() -> int:
+    """
+    Get the peak resident memory of this process and its workers so far.
+
+    :return: The peak, in kilobytes.
+    """
+    return max(getrusage(RUSAGE_SELF).ru_maxrss, getrusage(RUSAGE_CHILDREN).ru_maxrss)
+
+
+def run_stage(stage: Callable[[], object], directory: str) -> Dict[str, float]:
+    """
+    Run a stage of the build and measure it.
+
+    :param stage: The stage.
+    :param directory: Directory the stage writes its files to.
+    :return: Seconds the stage took, the peak memory up to the end of
+        the stage, and the number and size of the files it wrote.
+    """
+    before = list_files(directory)
+    start = perf_counter()
+    stage()
+    seconds = perf_counter() - start
+    written = [size for path, (size, mtime) in list_files(directory).items() if before.get(path) != (size, mtime)]
+    return {"seconds": seconds, "max_rss_kb": max_rss(), "files_written": len(written),
+            "bytes_written": sum(written)}
+
+
+def prepare_site(site: str, directory: str) -> None:
+    """
+    Copy the inputs of the site into a directory and work in it.
+
+    :param site: Directory holding templates/, equivalents.json and setup.sql.
+    :param directory: Directory to build the site in.
+    """
+    copytree(join(site, 'templates'), join(directory, 'templates'))
+    copy(join(site, 'equivalents.json'), directory)
+    copy(join(site, 'setup.sql'), directory)
+    chdir(directory)
+    for path in ['folio/', 'word/']:
+        Path(path).mkdir()
+
+
+def read_pages() -> Dict[str, bytes]:
+    """
+    Read the folio and word pages of the site in the working directory.
+
+    :return: Path -> contents pairs.
+    """
+    pages = {}
+    for path in list_files('folio').keys() | list_files('word').keys():
+        with open(path, 'rb') as file:
+            pages[path] = file.read()
+    return pages
+
+
+def verify_jobs(shape: CorpusShape, site: str, jobs: int, seed: int = 0) -> List[str]:
+    """
+    Generate the folio and word pages of a transcription of two
+        transcribers in one process and then in several, in a temporary
+        directory, and compare them.
+
+    :param shape: Shape of the transcription.
+    :param site: Directory holding templates/, equivalents.json and setup.sql.
+    :param jobs: Number of processes to compare with one.
+    :param seed: Seed of the transcription.
+    :return: Paths of the pages that differ, or that only one of the builds generated.
+    """
+    with TemporaryDirectory(prefix='vsig-verify-') as directory:
+        prepare_site(site, directory)
+        with open('transcription.txt', 'w') as file:
+            generate_corpus(file, shape, seed, ('H', 'C'))
+        import parser  # All of them read their inputs relative to the working directory once imported.
+        import variants
+        import vsig
+        simplefilter('ignore', vsig.MissingImageWarning)  # There are no images to find.
+        db_file = 'voynich.db'
+        parser.sqlite_create_tables(db_file)
+        with open('transcription.txt') as transcription:
+            parser.ingest(parser.read_records(transcription), db_file)
+        variants.insert_variants(db_file)
+        builds = []
+        for build_jobs in [1, jobs]:
+            vsig.generate_folio_pages(db_file, build_jobs, {})
+            vsig.generate_word_pages(db_file, build_jobs, {})
+            builds.append(read_pages())
+        chdir(site)
+    serial, parallel = builds
+    return sorted(path for path in serial.keys() | parallel.keys() if serial.get(path) != parallel.get(path))
+
+
+def run_benchmark(shape: CorpusShape, site: str, jobs: int = 1, seed: int = 0) -> Dict[str, object]:
+    """
+    Build a site from a synthetic transcription in a temporary directory,
+        stage by stage.
+
+    :param shape: Shape of the transcription.
+    :param site: Directory holding templates/, equivalents.json and setup.sql.
+    :param jobs: Number of processes to generate the pages with.
+    :param seed: Seed of the transcription.
+    :return: Shape of the transcription and the measurements of each stage.
+    """
+    with TemporaryDirectory(prefix='vsig-benchmark-') as directory:
+        prepare_site(site, directory)
+        with open('transcription.txt', 'w') as file:
+            generate_corpus(file, shape, seed)
+        import parser  # Both read their inputs relative to the working directory once imported.
+        import vsig
+        simplefilter('ignore', vsig.MissingImageWarning)  # There are no images to find.
+        parts: Dict[str, float] = {}
+        parser.parse_word_appearances = timed(parser.parse_word_appearances, 'parse_word_appearances', parts)
+        parser.insert_values = timed(parser.insert_values, 'insert_values', parts)
+        db_file = 'voynich.db'
+
+        def ingest():
+            parser.sqlite_create_tables(db_file)
+            with open('transcription.txt') as transcription:
+                parser.ingest(timed_iterator(parser.read_records(transcription), 'read_records', parts), db_file)
+
+        stages = {"ingest": run_stage(ingest, directory)}
+        stages["ingest"]["parts"] = parts
+        stages["generate_folio_pages"] = run_stage(lambda: vsig.generate_folio_pages(db_file, jobs), directory)
+        stages["generate_word_pages"] = run_stage(lambda: vsig.generate_word_pages(db_file, jobs), directory)
+        stages["generate_search_index"] = run_stage(lambda: vsig.generate_search_index(db_file), directory)
+        stages["generate_index_pages"] = run_stage(lambda: vsig.generate_index_pages(db_file), directory)
+        with sql.connect(db_file) as db:
+            cursor = db.cursor()
+            corpus = {"folios": cursor.execute("SELECT count(*) FROM Folio").fetchone()[0],
+                      "lines": cursor.execute("SELECT count(*) FROM Paragraph").fetchone()[0],
+                      "words": cursor.execute("SELECT count(*) FROM Word").fetchone()[0],
+                      "tokens": cursor.execute("SELECT sum(occurrenceCount) FROM Appears").fetchone()[0]}
+        chdir(site)
+    return {"shape": shape._asdict(), "corpus": corpus, "stages": stages}
+
+
+def stage_seconds(run: Dict[str, object]) -> Dict[str, float]:
+    """
+    Get the seconds of every stage of a run, and of the parts of the stages.
+
+    :param run: A run from the results.
+    :return: Stage -> seconds pairs, parts are named stage.part.
+    """
+    seconds = {}
+    for stage, measurements in run["stages"].items():
+        seconds[stage] = measurements["seconds"]
+        for part, part_seconds in measurements.get("parts", {}).items():
+            seconds[f"{stage}.{part}"] = part_seconds
+    return seconds
+
+
+def compare_results(results: Dict[str, object], baseline: Dict[str, object], threshold: float) -> int:
+    """
+    Print the times of the stages next to those of the baseline.
+
+    :param results: Results of this run.
+    :param baseline: Results to compare with.
+    :param threshold: Ratio to the baseline above which a stage is slower.
+    :return: Number of stages slower than the baseline.
+    """
+    slower = 0
+    baseline_runs = {run["label"]: run for run in baseline["runs"]}
+    for run in results["runs"]:
+        if run["label"] not in baseline_runs:
+            print(f"{run['label']}: not in the baseline.")
+            continue
+        print(f"{run['label']}:")
+        old_seconds = stage_seconds(baseline_runs[run["label"]])
+        for stage, seconds in stage_seconds(run).items():
+            if stage not in old_seconds:
+                print(f"    {stage:40} {seconds:9.3f}s  (new)")
+                continue
+            ratio = seconds / old_seconds[stage] if old_seconds[stage] else float('inf')
+            mark = ''
+            if ratio > threshold:
+                mark = '  slower'
+                slower += 1
+            print(f"    {stage:40} {old_seconds[stage]:9.3f}s -> {seconds:9.3f}s  x{ratio:.2f}{mark}")
+    return slower
+
+
+if __name__ == '__main__':
+    program = ArgumentParser(description="Benchmark the stages of the build on synthetic transcriptions.")
+    program.add_argument("--scales", "-s", type=float, nargs='+', default=[1],
+                         help="Sizes of the transcriptions, relative to the manuscript.")
+    program.add_argument("--dimensions", "-d", nargs='+', choices=sorted(dimensions),
+                         default=['folios', 'vocabulary'], help="Dimensions of the transcription to scale.")
+    program.add_argument("--site", default='.', help="Directory holding templates/, equivalents.json and setup.sql.")
+    program.add_argument("--jobs", "-j", type=int, default=1, help="Number of processes to generate pages with.")
+    program.add_argument("--seed", type=int, default=0, help="Seed of the synthetic transcriptions.")
+    program.add_argument("--output", "-o", default='benchmark.json', help="File to save the results to.")
+    program.add_argument("--baseline", "-b", help="Results of an earlier run to compare with.")
+    program.add_argument("--threshold", type=float, default=1.1,
+                         help="Ratio to the baseline above which a stage counts as slower.")
+    program.add_argument("--verify", action="store_true",
+                         help="Rather than timing the stages, check that the pages generated with --jobs processes "
+                              "are the same as the ones generated with one, for two transcribers.")
+    args = program.parse_args()
+    site = abspath(args.site)
+    if args.verify:
+        for scale in args.scales:
+            differing = verify_jobs(scale_shape(manuscript_shape, scale, args.dimensions), site, args.jobs, args.seed)
+            print(f"{scale:g}x: {len(differing)} pages differ with {args.jobs} processes.")
+            for path in differing[:20]:
+                print(f"    {path}")
+            if differing:
+                sys.exit(1)
+        sys.exit(0)
+    results = {"environment": {"python": platform.python_version(), "sqlite": sql.sqlite_version,
+                               "platform": platform.platform(), "cpus": cpu_count(), "jobs": args.jobs},
+               "runs": []}
+    context = get_context('spawn')  # A fresh process for each run, so that peak memory is its own.
+    for scale in args.scales:
+        shape = scale_shape(manuscript_shape, scale, args.dimensions)
+        label = f"{scale:g}x {'+'.join(sorted(args.dimensions))}"
+        print(f"Running {label}: {shape}")
+        with context.Pool(1) as pool:
+            run = pool.apply(run_benchmark, (shape, site, args.jobs, args.seed))
+        results["runs"].append({"label": label, **run})
+        for stage, seconds in stage_seconds(run).items():
+            print(f"    {stage:40} {seconds:9.3f}s")
+    with open(args.output, 'w') as fp:
+        dump(results, fp, indent=1)
+    if args.baseline:
+        with open(args.baseline) as fp:
+            if compare_results(results, load(fp), args.threshold):
+                sys.exit(1)
@@ -0,0 +1,234 @@
+"""
+Check the generated site for links to pages that do not exist, such as
+    the word pages of odd tokens, images that are missing, anchors that
+    no line has, images in media/ that no page shows, and word pages that
+    no page links to. The files of the site are listed once, and the
+    pages are read with a streaming HTML parser in parallel, each
+    process returning the links and the ids of its pages. The links of
+    the pages are kept in a cache file, so that after a build only the
+    pages it wrote are parsed again. Run from the root of the
+    repository, like VSIG.py.
+"""
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from html.parser import HTMLParser
+from json import dump, load
+from os import stat, walk
+from os.path import dirname, exists, isdir, join, normpath, splitext
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+from urllib.parse import unquote, urlsplit
+
+site_paths = ['index.html', 'about', 'folio', 'word', 'search', 'stats', 'styles', 'scripts', 'media']
+image_extensions = {'.jpg', '.jpeg', '.png'}
+cache_file = 'site_check.json'  # Page -> size and modification time, references and ids of the page.
+crops_index = 'media/crops/index.json'  # Crop -> image it was cropped from, written by folio_split.py.
+
+
+class Reference(NamedTuple):
+    """
+    A link or an image of a page, resolved relative to the root of the site.
+    """
+    image: bool
+    target: str
+    fragment: str
+
+
+class PageLinks(NamedTuple):
+    """
+    What a page refers to, and the ids other pages can link to.
+    """
+    page: str
+    references: List[Reference]
+    ids: Set[str]
+
+
+class Report(NamedTuple):
+    """
+    Problems found in the site, as page, target pairs, or paths.
+    """
+    dangling_links: List[Tuple[str, str]]
+    missing_images: List[Tuple[str, str]]
+    missing_anchors: List[Tuple[str, str]]
+    unreferenced_media: List[str]
+    orphan_word_pages: List[str]
+
+
+class LinkParser(HTMLParser):
+    """
+    Collects the references and the ids of a page as it is parsed.
+    """
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.references: List[Tuple[bool, str]] = []  # Is an image, reference pairs.
+        self.ids: Set[str] = set()
+
+    def handle_starttag(self, tag, attrs):
+        for name, value in attrs:
+            if value is None:
+                continue
+            if name == 'id':
+                self.ids.add(value)
+            elif name in ('href', 'src'):
+                self.references.append((tag == 'img', value))
+            elif name == 'data-dzi':
+                self.references.append((True, value))
+            elif name == 'srcset':
+                self.references.extend((True, candidate.split()[0]) for candidate in value.split(',')
+                                       if candidate.strip())
+
+
+@lru_cache(maxsize=1 << 16)
+def resolve(directory: str, reference: str) -> Optional[Tuple[str, str]]:
+    """
+    Resolve a reference to a path relative to the root of the site, the
+        pages of a directory share most of their references, such as
+        the links of the word pages to the folios.
+
+    :param directory: Directory of the page.
+    :param reference: Value of the href or src, which has a path.
+    :return: The path and the fragment, None if the reference is to another site.
+    """
+    parts = urlsplit(reference)
+    if parts.scheme or parts.netloc:
+        return None
+    path = unquote(parts.path)
+    target = normpath(path.lstrip('/') if path.startswith('/') else join(directory, path))
+    if path.endswith('/'):
+        target = join(target, 'index.html')
+    return target.replace('\\', '/'), parts.fragment
+
+
+def read_pages(pages: List[str]) -> List[PageLinks]:
+    """
+    Parse pages for their references and ids.
+
+    :param pages: Paths of the pages.
+    :return: The references and the ids of each page.
+    """
+    links = []
+    for page in pages:
+        parser = LinkParser()
+        with open(page, encoding='utf-8', errors='replace') as file:
+            for block in iter(lambda: file.read(1 << 16), ''):
+                parser.feed(block)
+        parser.close()
+        references = []
+        directory = dirname(page)
+        for image, reference in parser.references:
+            resolved = (page, reference[1:]) if reference.startswith('#') else resolve(directory, reference)
+            if resolved is not None:
+                references.append(Reference(image, *resolved))
+        links.append(PageLinks(page, references, parser.ids))
+    return links
+
+
+def list_files(paths: List[str]) -> Set[str]:
+    """
+    List every file of the site.
+
+    :param paths: Files and directories of the site.
+    :return: Paths of the files, with / as the separator.
+    """
+    files = set()
+    for path in paths:
+        if isdir(path):
+            for directory, _, names in walk(path):
+                files.update(join(directory, name).replace('\\', '/') for name in names)
+        elif exists(path):
+            files.add(path)
+    return files
+
+
+def read_changed_pages(pages: List[str], jobs: int = 1, cache: Optional[str] = cache_file) -> List[PageLinks]:
+    """
+    Parse the pages that changed since they were cached, and update the cache.
+
+    :param pages: Paths of the pages.
+    :param jobs: Number of processes to parse the pages with.
+    :param cache: Path of the cache file, None not to use a cache.
+    :return: The references and the ids of each page, in the order of the pages.
+    """
+    cached = {}
+    if cache is not None and exists(cache):
+        with open(cache) as fp:
+            cached = load(fp)
+    versions = {}
+    for page in pages:
+        status = stat(page)
+        versions[page] = [status.st_size, status.st_mtime_ns]
+    changed = [page for page in pages if page not in cached or cached[page][0] != versions[page]]
+    if jobs <= 1:
+        parsed = read_pages(changed)
+    else:
+        chunk_size = max(1, -(-len(changed) // (jobs * 4)))  # A few chunks per process balance the load.
+        chunks = [changed[start:start + chunk_size] for start in range(0, len(changed), chunk_size)]
+        with ProcessPoolExecutor(jobs) as executor:
+            parsed = [page_links for chunk in executor.map(read_pages, chunks) for page_links in chunk]
+    for page, references, ids in parsed:
+        cached[page] = [versions[page], references, sorted(ids)]
+    if cache is not None and changed:
+        with open(cache, 'w') as fp:
+            dump({page: cached[page] for page in pages}, fp, separators=(',', ':'))
+    return [PageLinks(page, [Reference(*reference) for reference in cached[page][1]], set(cached[page][2]))
+            for page in pages]
+
+
+def check_site(jobs: int = 1, paths: List[str] = site_paths, cache: Optional[str] = cache_file) -> Report:
+    """
+    Check the links and the images of every page of the site.
+
+    :param jobs: Number of processes to parse the pages with.
+    :param paths: Files and directories of the site.
+    :param cache: Path of the cache file, None not to use a cache.
+    :return: The problems found.
+    """
+    files = list_files(paths)
+    pages = sorted(path for path in files if path.endswith('.html'))
+    links = read_changed_pages(pages, jobs, cache)
+    ids: Dict[str, Set[str]] = {page_links.page: page_links.ids for page_links in links}
+    report = Report([], [], [], [], [])
+    referenced: Set[str] = set()
+    for page, references, _ in links:
+        for image, target, fragment in references:
+            if target not in files:
+                (report.missing_images if image else report.dangling_links).append((page, target))
+                continue
+            if target != page:
+                referenced.add(target)
+            if fragment and target in ids and fragment not in ids[target]:
+                report.missing_anchors.append((page, f'{target}#{fragment}'))
+    if exists(crops_index):  # The images the shown crops are cut from are used, though no page shows them.
+        with open(crops_index) as fp:
+            referenced.update(source for crop, source in load(fp).items() if crop in referenced)
+    report.unreferenced_media.extend(sorted(path for path in files - referenced if dirname(path) == 'media'
+                                            and splitext(path)[1].lower() in image_extensions))
+    report.orphan_word_pages.extend(sorted(page for page in pages if dirname(page) == 'word' and
+                                           page != 'word/index.html' and page not in referenced))
+    return report
+
+
+def print_report(report: Report, limit: int = 20) -> None:
+    """
+    Print the number of each kind of problem, and the first few of each.
+
+    :param report: The problems found.
+    :param limit: Number of problems of each kind to print.
+    """
+    for kind, problems in report._asdict().items():
+        print(f"{kind.replace('_', ' ').capitalize()}: {len(problems)}")
+        for problem in problems[:limit]:
+            print('    ' + (' -> '.join(problem) if isinstance(problem, tuple) else problem))
+        if len(problems) > limit:
+            print(f'    and {len(problems) - limit} more.')
+
+
+if __name__ == '__main__':
+    program = ArgumentParser(description="Check the links and the images of the generated site.")
+    program.add_argument("--jobs", "-j", type=int, default=1, help="Number of processes to parse the pages with.")
+    program.add_argument("--limit", "-l", type=int, default=20, help="Number of problems of each kind to print.")
+    program.add_argument("--no_cache", action="store_true", help="Parse every page, rather than the changed ones.")
+    args = program.parse_args()
+    site_report = check_site(args.jobs, cache=None if args.no_cache else cache_file)
+    print_report(site_report, args.limit)
+    exit(1 if any(site_report) else 0)
@@ -0,0 +1,205 @@
+"""
+Statistics of the words of each transcriber, the rank and frequency of
+    the words against Zipf's law, the lengths of the words, the entropy
+    of their characters and character bigrams, and the same measures
+    for each section of the manuscript and each Currier language. They
+    are computed over the token stream of token_bundle.py and saved to
+    the database for the VSIG.py to show, along with the hash of the
+    transcription they were computed from, so that they are computed
+    again only when the transcription changes.
+"""
+import re
+from argparse import ArgumentParser
+from json import dumps
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from manifest import hash_file, hash_inputs
+from metrics import connect
+from token_bundle import TokenBundle, build_bundle, transcriber_range
+
+sections = [('Herbal', 1, 66), ('Astronomical', 67, 73), ('Biological', 75, 84), ('Cosmological', 85, 86),
+            ('Pharmaceutical', 87, 102), ('Recipes', 103, 116)]  # Name, first and last folio number.
+folio_number_pattern = re.compile(r'f(\d+)')
+statistics_hash = hash_file(__file__)  # Changes to the statistics invalidate the saved ones.
+top_count = 20  # Number of the most frequent words to keep.
+zipf_points = 64  # Number of ranks to keep for the rank and frequency chart.
+
+
+class Characters:
+    """
+    Characters of the vocabulary, so that the characters and the
+        character bigrams of any selection of tokens are counted by
+        weighting the characters of each word by its frequency.
+    """
+    def __init__(self, words: np.ndarray):
+        """
+        :param words: The vocabulary.
+        """
+        lengths = np.char.str_len(words) if len(words) else np.zeros(0, dtype=np.int64)
+        code_points = np.frombuffer(''.join(words.tolist()).encode('utf-32-le'), dtype=np.uint32)
+        self.characters, self.codes = np.unique(code_points, return_inverse=True)
+        self.word_of_character = np.repeat(np.arange(len(words)), lengths)
+        within_word = self.word_of_character[1:] == self.word_of_character[:-1]
+        self.bigram_codes = (self.codes[:-1] * len(self.characters) + self.codes[1:])[within_word]
+        self.word_of_bigram = self.word_of_character[:-1][within_word]
+        self.lengths = lengths
+
+    def counts(self, frequencies: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Count the characters and the character bigrams of the tokens.
+
+        :param frequencies: Number of tokens of each word of the vocabulary.
+        :return: Number of each character, and of each character bigram.
+        """
+        return (np.bincount(self.codes, weights=frequencies[self.word_of_character],
+                            minlength=len(self.characters)),
+                np.bincount(self.bigram_codes, weights=frequencies[self.word_of_bigram],
+                            minlength=len(self.characters) ** 2))
+
+
+def entropy(counts: np.ndarray) -> float:
+    """
+    Get the Shannon entropy of a distribution.
+
+    :param counts: Number of observations of each outcome.
+    :return: The entropy in bits.
+    """
+    counts = counts[counts > 0]
+    if not len(counts):
+        return 0.0
+    probabilities = counts / counts.sum()
+    return float(-(probabilities * np.log2(probabilities)).sum())
+
+
+def zipf(frequencies: np.ndarray) -> Tuple[float, List[Tuple[int, int]]]:
+    """
+    Fit Zipf's law, frequency proportional to rank to the power of minus
+        the exponent, to the frequencies of the words by least squares
+        on their logarithms.
+
+    :param frequencies: Number of tokens of each word.
+    :return: The exponent, and rank, frequency pairs at ranks spread evenly on a logarithmic scale.
+    """
+    ranked = np.sort(frequencies[frequencies > 0])[::-1]
+    if len(ranked) < 2:
+        return 0.0, [(i + 1, int(frequency)) for i, frequency in enumerate(ranked)]
+    ranks = np.arange(1, len(ranked) + 1)
+    slope = np.polyfit(np.log(ranks), np.log(ranked), 1)[0]
+    kept = np.unique(np.geomspace(1, len(ranked), zipf_points).astype(np.int64))
+    return float(-slope), [(int(rank), int(ranked[rank - 1])) for rank in kept]
+
+
+def group_statistics(frequencies: np.ndarray, words: np.ndarray, characters: Characters) -> Dict[str, object]:
+    """
+    Get the measures of a selection of tokens that are compared between the selections.
+
+    :param frequencies: Number of tokens of each word of the vocabulary in the selection.
+    :param words: The vocabulary.
+    :param characters: Characters of the vocabulary.
+    :return: Measure -> value pairs.
+    """
+    tokens = int(frequencies.sum())
+    distinct = int(np.count_nonzero(frequencies))
+    character_counts, bigram_counts = characters.counts(frequencies)
+    character_entropy = entropy(character_counts)
+    bigram_entropy = entropy(bigram_counts)
+    top = np.argsort(-frequencies, kind='stable')[:min(top_count, distinct)]
+    return {
+        "tokens": tokens,
+        "words": distinct,
+        "type_token_ratio": distinct / tokens if tokens else 0.0,
+        "mean_length": float(characters.lengths @ frequencies / tokens) if tokens else 0.0,
+        "character_entropy": character_entropy,
+        "bigram_entropy": bigram_entropy,
+        "conditional_entropy": bigram_entropy - character_entropy,  # Of a character given the one before it.
+        "top_words": [(str(words[i]), int(frequencies[i])) for i in top]
+    }
+
+
+def section_of(folio_name: str) -> Optional[str]:
+    """
+    Get the section of the manuscript a folio belongs to.
+
+    :param folio_name: Name of the folio.
+    :return: Name of the section, None if the folio is in none of them.
+    """
+    number = int(folio_number_pattern.match(folio_name).group(1))
+    return next((name for name, first, last in sections if first <= number <= last), None)
+
+
+def compute_statistics(bundle: TokenBundle, languages: Dict[str, str],
+                       transcriber: Optional[str] = None) -> Dict[str, object]:
+    """
+    Compute the statistics of the words of a transcriber.
+
+    :param bundle: Token stream of the database.
+    :param languages: Folio name -> Currier language pairs.
+    :param transcriber: Name of the transcriber, the first one if not given.
+    :return: Statistic -> value pairs, ready to be saved as JSON.
+    """
+    start, end = transcriber_range(bundle, transcriber)
+    tokens = bundle.tokens[start:end]
+    words = np.asarray(bundle.words)
+    counted = words != ''  # Empty words are left by doubled separators.
+    characters = Characters(words)
+    # Folio of each token, through the runs of lines of the folios.
+    run_tokens = np.diff(bundle.paragraph_offsets[bundle.folio_offsets])
+    token_runs = np.repeat(np.arange(len(run_tokens)), run_tokens)[start:end]
+    frequencies = np.bincount(tokens, minlength=len(words)) * counted
+    exponent, ranks = zipf(frequencies)
+    statistics = group_statistics(frequencies, words, characters)
+    statistics.update({
+        "zipf_exponent": exponent,
+        "zipf": ranks,
+        "word_lengths": np.bincount(characters.lengths, weights=frequencies).astype(np.int64).tolist()
+    })
+    for key, group_of in [("sections", section_of), ("languages", languages.get)]:
+        run_groups = np.array([group_of(str(folio_name)) or '' for folio_name in bundle.folios], dtype=object)
+        token_groups = run_groups[token_runs]
+        statistics[key] = {
+            str(group): group_statistics(np.bincount(tokens[token_groups == group], minlength=len(words)) * counted,
+                                         words, characters)
+            for group in sorted(set(token_groups) - {''})
+        }
+    return statistics
+
+
+def update_statistics(db_file: str, force: bool = False) -> List[str]:
+    """
+    Compute the statistics of the transcribers whose transcription
+        changed since their statistics were saved, and save them.
+
+    :param db_file: Database file, of type SQLite3
+    :param force: Compute the statistics of every transcriber.
+    :return: Names of the transcribers whose statistics were computed.
+    """
+    with connect(db_file) as db:
+        cursor = db.cursor()
+        languages = dict(cursor.execute("SELECT folioName, language FROM Folio WHERE language IS NOT NULL"))
+        saved = dict(cursor.execute("SELECT transcriberID, inputHash FROM Statistics"))
+        changed = []
+        for transcriber_id, name, input_hash in cursor.execute(
+                "SELECT transcriberID, transcriberName, inputHash FROM Transcriber ORDER BY transcriberID").fetchall():
+            statistics_input = hash_inputs(statistics_hash, input_hash, sorted(languages.items()))
+            if force or input_hash is None or saved.get(transcriber_id) != statistics_input:
+                changed.append((transcriber_id, name, statistics_input))
+        if not changed:
+            return []
+        bundle = build_bundle(cursor)
+        rows = [(transcriber_id, statistics_input, dumps(compute_statistics(bundle, languages, name)))
+                for transcriber_id, name, statistics_input in changed]
+        cursor.executemany("INSERT OR REPLACE INTO Statistics(transcriberID, inputHash, statistics) VALUES(?, ?, ?)",
+                           rows)
+        cursor.execute("DELETE FROM Statistics WHERE transcriberID NOT IN (SELECT transcriberID FROM Transcriber)")
+        db.commit()
+    return [name for _, name, _ in changed]
+
+
+if __name__ == '__main__':
+    program = ArgumentParser(description="Compute the statistics of the words of the Voynich Manuscript.")
+    program.add_argument("input", help="Voynich data in a SQLite3 file")
+    program.add_argument("--force", action="store_true",
+                         help="Compute the statistics even if the transcription did not change.")
+    args = program.parse_args()
+    computed = update_statistics(args.input, args.force)
+    print(f"Computed the statistics of {', '.join(computed)}." if computed else "The statistics are up to date.")
@@ -1,71 +1,223 @@
 from bs4 import BeautifulSoup
 from bs4.element import Tag
-from requests import get
-from time import sleep
-from typing import Dict, List
+from requests import Session, RequestException
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from hashlib import sha1
+from os import replace
+from os.path import exists, getsize, join
+from threading import Lock
+from time import sleep, monotonic
+from typing import Dict, Optional
+from urllib.parse import urljoin
+from manifest import load_manifest, save_manifest
 
+media_path = 'media'
+fetch_manifest_file = 'media/fetched.json'  # Folio name -> link, ETag, Last-Modified, size and hash of the image.
+timeout = 30
 
-def get_commons_page(url: str) -> str:
+
+class RateLimiter:
+    """
+    Spaces out the requests of every thread, so that no more
+        than the given number of requests are sent per second.
+    """
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0
+        self.next_time = monotonic()
+        self.lock = Lock()
+
+    def wait(self) -> None:
+        """
+        Wait until the next request may be sent.
+        """
+        with self.lock:
+            now = monotonic()
+            delay = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if delay > 0:
+            sleep(delay)
+
+
+def create_session(jobs: int, retries: int, backoff: float) -> Session:
+    """
+    Create a session whose connections are pooled and shared
+        by the threads, failed requests are retried with backoff.
+
+    :param jobs: Number of threads that will use the session.
+    :param retries: Number of times a request is retried.
+    :param backoff: Backoff factor of the retries, in seconds.
+    :return: The session.
+    """
+    session = Session()
+    retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=[429, 500, 502, 503, 504])
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(1, jobs), max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['User-Agent'] = 'VoynichExplorer media fetcher (https://github.com/ambertide/VoynichExplorer)'
+    return session
+
+
+def get_commons_page(url: str, session: Session, limiter: RateLimiter) -> str:
     """
     Get the HTML source code of the WikiMedia Commons
         page to get Voynich page media urls.
 
     :param url: URL of the WikiMedia Commons Page.
+    :param session: Session to send the request with.
+    :param limiter: Rate limiter of the requests.
     :return: the HTML Source code of the page.
     """
-    response = get(url)
-    text = response.text
-    response.close()
-    return text
+    limiter.wait()
+    with session.get(url, timeout=timeout) as response:
+        response.raise_for_status()
+        return response.text
+
+
+def get_image_link(image_page: str, session: Session, limiter: RateLimiter) -> str:
+    """
+    Get the link to the full image from its WikiMedia Commons page.
+
+    :param image_page: Link to the WikiMedia Commons page of the image.
+    :param session: Session to send the request with.
+    :param limiter: Rate limiter of the requests.
+    :return: The link to the image.
+    """
+    soup = BeautifulSoup(get_commons_page(image_page, session, limiter), 'html.parser')
+    full_image_box = soup.find("div", class_='fullImageLink')
+    return urljoin(image_page, full_image_box.a['href'])
 
 
-def get_image(name: str, image_link: str) -> None:
+def download_image(name: str, link: str, session: Session, limiter: RateLimiter, entry: Dict[str, object]) -> bool:
+    """
+    Stream an image to the media/ folder, unless it did not change since
+        the last download, an interrupted download is resumed.
+
+    :param name: Name of the folio page.
+    :param link: Link to the image.
+    :param session: Session to send the request with.
+    :param limiter: Rate limiter of the requests.
+    :param entry: Manifest entry of the image, updated in place.
+    :return: True if the image was downloaded, False if it did not change.
+    """
+    path = join(media_path, f"{name}.jpg")
+    part_path = path + '.part'
+    headers = {}
+    if exists(path) and entry.get('link') == link and entry.get('size') == getsize(path):
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+    elif exists(part_path) and entry.get('link') == link and entry.get('etag'):
+        headers['Range'] = f'bytes={getsize(part_path)}-'
+        headers['If-Range'] = entry['etag']  # The server sends the whole image if it changed.
+    limiter.wait()
+    with session.get(link, headers=headers, stream=True, timeout=timeout) as response:
+        if response.status_code == 304:
+            return False
+        response.raise_for_status()
+        entry.update(link=link, etag=response.headers.get('ETag'), last_modified=response.headers.get('Last-Modified'),
+                     size=None, sha1=None)
+        digest = sha1()
+        mode = 'wb'
+        if response.status_code == 206:
+            mode = 'ab'
+            with open(part_path, 'rb') as part_file:
+                for block in iter(lambda: part_file.read(1 << 16), b''):
+                    digest.update(block)
+        with open(part_path, mode) as media_file:
+            for block in response.iter_content(1 << 16):
+                media_file.write(block)
+                digest.update(block)
+    replace(part_path, path)
+    entry.update(size=getsize(path), sha1=digest.hexdigest())
+    return True
+
+
+def get_image(name: str, image_page: str, session: Session, limiter: RateLimiter,
+              entry: Dict[str, object], attempts: int = 3, backoff: float = 0.5) -> bool:
     """
     Get the Image page from the WikiMedia commons and download
         the images to the media/ folder with proper names.
 
     :param name: Name of the folio page.
-    :param image_link: Link to the WikiMedia Commons page.
+    :param image_page: Link to the WikiMedia Commons page.
+    :param session: Session to send the requests with.
+    :param limiter: Rate limiter of the requests.
+    :param entry: Manifest entry of the image, updated in place.
+    :param attempts: Number of times to try, an interrupted download
+        is resumed by the next attempt.
+    :param backoff: Seconds to wait before the second attempt, doubled
+        after each attempt.
+    :return: True if the image was downloaded, False if it did not change.
     """
-    response = get(image_link)
-    html_body = response.text
-    response.close()
-    soup = BeautifulSoup(html_body, 'html.parser')
-    full_image_box = soup.find("div", class_='fullImageLink')
-    link = full_image_box.a['href']
-    image = get(link)
-    sleep(0.05)
-    with open(f"media/{name}.jpg", "wb+") as media_file:
-        media_file.write(image.content)
-    image.close()
+    for attempt in range(attempts):
+        try:
+            link: Optional[str] = entry.get('link') if entry.get('page') == image_page else None
+            if link is None:  # The link of the image is only looked up once.
+                link = get_image_link(image_page, session, limiter)
+                entry.update(page=image_page, link=None)
+            try:
+                return download_image(name, link, session, limiter, entry)
+            except RequestException as error:
+                if error.response is not None and error.response.status_code == 404:
+                    entry['page'] = None  # The image moved, look its link up again.
+                raise
+        except RequestException:
+            if attempt == attempts - 1:
+                raise
+            sleep(backoff * 2 ** attempt)
+    return False
 
 
-def get_folio_urls(html_source: str) -> Dict[str, str]:
+def get_folio_urls(html_source: str, base_url: str = "https://commons.wikimedia.org") -> Dict[str, str]:
     """
     Get the image URL's for each folio page.
 
     :param html_source: HTML Source code of the WikiMedia
         Commons catalogue page containing links to each
         and every folio page.
+    :param base_url: URL of the WikiMedia Commons.
     :return: The URLs to each folio media.
     """
     links = {}
     soup = BeautifulSoup(html_source, 'html.parser')
-    galleryboxes: List[Tag] = soup.find_all("li", class_="gallerybox")  # These hold both the title and the link.
+    galleryboxes = soup.find_all("li", class_="gallerybox")  # These hold both the title and the link.
     for box in galleryboxes:
         text_box = box.find("div", class_="gallerytext")
         try:
             name = text_box.p.text
         except AttributeError:
             continue
-        url = box.find("a", class_="image")
-        links[name.replace('\n', '')] = "https://commons.wikimedia.org" + url['href']
+        url: Tag = box.find("a", class_="image")
+        links[name.replace('\n', '')] = urljoin(base_url, url['href'])
     return links
 
 
 if __name__ == '__main__':
-    image_urls = get_folio_urls(get_commons_page('https://commons.wikimedia.org/wiki/Voynich_manuscript'))
-    for folio_name in image_urls:
-        sleep(1)
-        get_image(folio_name, image_urls[folio_name])
-
+    program = ArgumentParser(description="Download the folio images from the WikiMedia Commons to media/.")
+    program.add_argument("--base_url", default="https://commons.wikimedia.org", help="URL of the WikiMedia Commons.")
+    program.add_argument("--gallery", default="/wiki/Voynich_manuscript", help="Path of the page listing the folios.")
+    program.add_argument("--jobs", "-j", type=int, default=4, help="Number of images to download at once.")
+    program.add_argument("--rate", type=float, default=5, help="Maximum number of requests per second.")
+    program.add_argument("--retries", type=int, default=3, help="Number of times to retry a failed request.")
+    program.add_argument("--backoff", type=float, default=0.5, help="Backoff factor of the retries, in seconds.")
+    args = program.parse_args()
+    session = create_session(args.jobs, args.retries, args.backoff)
+    limiter = RateLimiter(args.rate)
+    image_urls = get_folio_urls(get_commons_page(urljoin(args.base_url, args.gallery), session, limiter), args.base_url)
+    fetched = load_manifest(fetch_manifest_file)
+    try:
+        with ThreadPoolExecutor(args.jobs) as executor:
+            futures = {executor.submit(get_image, folio_name, image_urls[folio_name], session, limiter,
+                                       fetched.setdefault(folio_name, {}), args.retries + 1, args.backoff): folio_name
+                       for folio_name in image_urls}
+            for future in as_completed(futures):
+                try:
+                    print(f"{futures[future]}: {'downloaded' if future.result() else 'unchanged'}.")
+                except RequestException as error:
+                    print(f"{futures[future]}: failed, {error}")
+    finally:  # Keep what was downloaded, so that the next run resumes from here.
+        save_manifest(fetched, fetch_manifest_file)
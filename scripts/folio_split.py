@@ -5,13 +5,34 @@ Certain folio images are combinations of multiple
     basis, this program generates a JSON file that
     tells the VSIG.py single folio -> multi folio
     image name equivalents.
+    It also crops each folio out of the multi-folio images, by the
+    regions of the folios in regions.json, so that a folio page shows
+    only its own folio rather than the whole multi-folio image:
+
+        {"f68r1,r2,r3.jpg": {"reviewed": true, "folios": {"f68r1": [left, top, right, bottom], ...}}, ...}
+
+    where the coordinates are fractions of the width and the height of
+    the image. Only the images whose regions were reviewed by hand are
+    cropped, the folios of the others show the whole image. A crop is
+    only made again when its image or its region changes.
 """
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
 from re import compile, Pattern, findall
-from os import listdir
-from json import dump
-from typing import List, Dict
+from os import listdir, remove
+from os.path import exists, join
+from json import dump, load
+from pathlib import Path
+from typing import List, Dict, Tuple
+from PIL import Image
+from manifest import load_manifest, save_manifest, hash_inputs, hash_file
+from media_build import media_path, quality, save_jpeg
 
 valid_name_pattern: Pattern = compile(r'f\d+[v|r]]\d?')
+regions_file = 'regions.json'
+crops_path = 'media/crops'  # VSIG.py shows the crop of a folio rather than its multi-folio image.
+crops_index = join(crops_path, 'index.json')  # Crop -> image it was cropped from, for check_site.py.
+Region = List[float]  # Left, top, right and bottom, as fractions of the size of the image.
 
 
 def get_folio_names(name: str) -> List[str]:
@@ -63,6 +84,120 @@ def get_page_equivalents(names: List[str]) -> Dict[str, str]:
     return multi_single
 
 
+def default_regions(image_name: str) -> Dict[str, Region]:
+    """
+    Split a multi-folio image into strips of equal width, one per folio
+        in the order of its name, as a starting point for its regions.
+
+    :param image_name: Name of the multi-folio image.
+    :return: Folio -> region pairs.
+    """
+    folio_names = get_folio_names(image_name)
+    return {folio_name: [i / len(folio_names), 0.0, (i + 1) / len(folio_names), 1.0]
+            for i, folio_name in enumerate(folio_names)}
+
+
+def add_default_regions(image_names: List[str]) -> List[str]:
+    """
+    Add the default regions of the multi-folio images that have no regions
+        in regions.json yet, the regions that are there are kept. The
+        default regions are not marked as reviewed, so they are not
+        cropped until they are checked against the image.
+
+    :param image_names: Names of the multi-folio images.
+    :return: Names of the images whose regions were added.
+    """
+    regions: Dict[str, dict] = {}
+    if exists(regions_file):
+        with open(regions_file) as fp:
+            regions = load(fp)
+    added = [image_name for image_name in image_names if image_name not in regions]
+    for image_name in added:
+        regions[image_name] = {"reviewed": False, "folios": default_regions(image_name)}
+    with open(regions_file, 'w') as fp:
+        dump(regions, fp, indent=4, sort_keys=True)
+    return added
+
+
+def crop_folio(image_name: str, folio_name: str, region: Region) -> str:
+    """
+    Crop a folio out of a multi-folio image.
+
+    :param image_name: Name of the multi-folio image in media/.
+    :param folio_name: Name of the folio.
+    :param region: Region of the folio in the image.
+    :return: Path of the crop.
+    """
+    path = join(crops_path, folio_name + '.jpg')
+    with Image.open(join(media_path, image_name)) as source:
+        left, top, right, bottom = region
+        box = (round(left * source.width), round(top * source.height),
+               round(right * source.width), round(bottom * source.height))
+        save_jpeg(source.convert('RGB').crop(box), path)
+    return path
+
+
+def crop_folios(jobs: int = 1, force: bool = False) -> None:
+    """
+    Crop the folios of the reviewed regions of regions.json out of their
+        images, the folios whose image and region did not change since
+        they were cropped are skipped. The crops of the folios that no
+        reviewed region has anymore are removed, so that their pages
+        show the whole image again.
+
+    :param jobs: Number of worker processes.
+    :param force: Crop every folio, even if it did not change.
+    """
+    with open(regions_file) as fp:
+        regions: Dict[str, dict] = load(fp)
+    sources = {folio_name: image_name for image_name, image_regions in regions.items() if image_regions["reviewed"]
+               for folio_name in image_regions["folios"]}
+    Path(crops_path).mkdir(parents=True, exist_ok=True)
+    build_manifest = load_manifest()
+    crops_manifest = build_manifest.setdefault('crops', {})
+    for name in listdir(crops_path):
+        if name.endswith('.jpg') and name[:-len('.jpg')] not in sources:
+            remove(join(crops_path, name))
+            crops_manifest.pop(name[:-len('.jpg')], None)
+            print(f'Removed {join(crops_path, name)}.')
+    crops: List[Tuple[str, str, Region]] = []
+    hashes = {}
+    for image_name in sorted(set(sources.values())):
+        image_hash = hash_file(join(media_path, image_name))  # Each image is hashed once for all of its folios.
+        for folio_name, region in regions[image_name]["folios"].items():
+            hashes[folio_name] = hash_inputs(image_hash, region, quality)
+            if force or crops_manifest.get(folio_name) != hashes[folio_name] or \
+                    not exists(join(crops_path, folio_name + '.jpg')):
+                crops.append((image_name, folio_name, region))
+    try:
+        with ProcessPoolExecutor(max(1, jobs)) as executor:
+            for (_, folio_name, _), path in zip(crops, executor.map(crop_folio, *zip(*crops))):
+                crops_manifest[folio_name] = hashes[folio_name]
+                print(f'Cropped {path}.')
+    finally:  # Keep the crops that were made even if one of them fails.
+        save_manifest(build_manifest)
+        with open(crops_index, 'w') as fp:
+            dump({f'{crops_path}/{folio_name}.jpg': f'{media_path}/{image_name}'
+                  for folio_name, image_name in sorted(sources.items())
+                  if exists(join(crops_path, folio_name + '.jpg'))}, fp, indent=4)
+
+
 if __name__ == '__main__':
-    with open('equivalents.json', 'w') as fp:
-        dump(get_page_equivalents(listdir('media_multi/')), fp)
+    program = ArgumentParser(description="Map the folios to their multi-folio images, and crop them out of them.")
+    program.add_argument("--regions", action="store_true",
+                         help=f"Add equal-width regions to {regions_file} for the multi-folio images of "
+                              f"equivalents.json that have none, to be corrected by hand and marked as reviewed.")
+    program.add_argument("--crop", action="store_true",
+                         help=f"Crop the folios of the reviewed regions of {regions_file} out of their images.")
+    program.add_argument("--jobs", "-j", type=int, default=1, help="Number of processes to crop images with.")
+    program.add_argument("--force", action="store_true", help="Crop every folio, even if it did not change.")
+    args = program.parse_args()
+    if args.regions:
+        with open('equivalents.json') as fp:
+            multi_images = sorted(set(load(fp).values()))
+        print(f"Added the regions of {len(add_default_regions(multi_images))} images to {regions_file}.")
+    if args.crop:
+        crop_folios(args.jobs, args.force)
+    if not args.regions and not args.crop:
+        with open('equivalents.json', 'w') as fp:
+            dump(get_page_equivalents(listdir('media_multi/')), fp)
@@ -10,4 +10,22 @@ function changeVoynichFont(value) {
             voynichTextRule.fontWeight = 'bold';
             break;
     }
-}
\ No newline at end of file
+}
+
+function openDeepZoom(image) {
+    var viewer = document.createElement("div");
+    viewer.className = "deep_zoom";
+    viewer.style.width = "100%";
+    viewer.style.height = image.parentElement.clientHeight + "px";
+    var script = document.createElement("script");
+    script.src = "https://cdnjs.cloudflare.com/ajax/libs/openseadragon/4.1.0/openseadragon.min.js";
+    script.onload = function () {
+        image.parentElement.replaceChild(viewer, image);
+        OpenSeadragon({
+            element: viewer,
+            prefixUrl: "https://cdnjs.cloudflare.com/ajax/libs/openseadragon/4.1.0/images/",
+            tileSources: image.getAttribute("data-dzi")
+        });
+    };
+    document.head.appendChild(script);
+}
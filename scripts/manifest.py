@@ -0,0 +1,64 @@
+"""
+The build manifest holds the hashes of the inputs of
+    everything parser.py and VSIG.py generate, so that
+    pages and databases whose inputs have not changed
+    since the last build are not generated again.
+"""
+from hashlib import sha1
+from json import load, dump
+from os.path import exists
+from typing import Dict
+
+manifest_file = 'manifest.json'
+
+
+def load_manifest(path: str = manifest_file) -> Dict[str, Dict[str, str]]:
+    """
+    Load the build manifest.
+
+    :param path: Path of the manifest file.
+    :return: The manifest, sections of file path -> input hash pairs.
+    """
+    if not exists(path):
+        return {}
+    with open(path) as fp:
+        return load(fp)
+
+
+def save_manifest(manifest: Dict[str, Dict[str, str]], path: str = manifest_file) -> None:
+    """
+    Save the build manifest.
+
+    :param manifest: The manifest to save.
+    :param path: Path of the manifest file.
+    """
+    with open(path, 'w') as fp:
+        dump(manifest, fp, indent=0, sort_keys=True)
+
+
+def hash_inputs(*inputs: object) -> str:
+    """
+    Hash the inputs of a generated file.
+
+    :param inputs: Inputs, hashed by their string representations.
+    :return: The hex digest of the inputs.
+    """
+    digest = sha1()
+    for input_ in inputs:
+        digest.update(str(input_).encode())
+        digest.update(b'\0')  # So that ('ab', 'c') and ('a', 'bc') differ.
+    return digest.hexdigest()
+
+
+def hash_file(path: str) -> str:
+    """
+    Hash the contents of a file without reading it whole.
+
+    :param path: Path of the file.
+    :return: The hex digest of the file.
+    """
+    digest = sha1()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 16), b''):
+            digest.update(block)
+    return digest.hexdigest()
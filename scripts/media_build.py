@@ -0,0 +1,153 @@
+"""
+Folio images are large scans, and the multi-folio images are
+    larger still, this program builds lighter versions of them
+    for the folio pages under media/derived/: a thumbnail, a few
+    widths for the srcset of the folio image, and deep zoom tiles
+    for the multi-folio images. An image is only processed again
+    when its contents or the settings below change.
+"""
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from json import dump
+from math import ceil, log2
+from os import listdir
+from os.path import exists, isdir, join, splitext
+from pathlib import Path
+from typing import Dict, List
+from PIL import Image
+from manifest import load_manifest, save_manifest, hash_inputs, hash_file
+
+media_path = 'media'
+derived_path = 'media/derived'
+widths = [480, 960, 1600]
+thumbnail_width = 200
+foldout_width = 3000  # Images wider than this are tiled, even if they are of a single folio.
+tile_size = 254
+tile_overlap = 1
+quality = 80
+settings = (widths, thumbnail_width, foldout_width, tile_size, tile_overlap, quality)
+
+
+def derived_directory(image_name: str) -> str:
+    """
+    Get the directory that holds the derivatives of an image.
+
+    :param image_name: Name of the image in media/.
+    :return: Path of the directory.
+    """
+    return join(derived_path, splitext(image_name)[0])
+
+
+def save_jpeg(image: Image.Image, path: str) -> None:
+    """
+    Save an image as a progressive JPEG.
+
+    :param image: Image to save.
+    :param path: Path to save the image to.
+    """
+    image.save(path, 'JPEG', quality=quality, optimize=True, progressive=True)
+
+
+def resize_to_width(image: Image.Image, width: int) -> Image.Image:
+    """
+    Resize an image to the given width, keeping its aspect ratio.
+
+    :param image: Image to resize.
+    :param width: Width of the new image.
+    :return: The resized image.
+    """
+    height = max(1, round(image.height * width / image.width))
+    return image.resize((width, height), Image.LANCZOS)
+
+
+def build_tiles(image: Image.Image, directory: str) -> str:
+    """
+    Build a Deep Zoom pyramid of the image, each level is half the
+        size of the level above it, and the last level is the image
+        itself, every level is cut into overlapping tiles.
+
+    :param image: Image to tile.
+    :param directory: Directory to save the tiles to.
+    :return: Name of the Deep Zoom descriptor file.
+    """
+    max_level = ceil(log2(max(image.width, image.height)))
+    level_image = image
+    for level in range(max_level, -1, -1):
+        level_directory = join(directory, 'tiles_files', str(level))
+        Path(level_directory).mkdir(parents=True, exist_ok=True)
+        width, height = level_image.size
+        for column in range(ceil(width / tile_size)):
+            for row in range(ceil(height / tile_size)):
+                left = max(0, column * tile_size - tile_overlap)
+                top = max(0, row * tile_size - tile_overlap)
+                right = min(width, (column + 1) * tile_size + tile_overlap)
+                bottom = min(height, (row + 1) * tile_size + tile_overlap)
+                save_jpeg(level_image.crop((left, top, right, bottom)), join(level_directory, f'{column}_{row}.jpg'))
+        level_image = level_image.resize((max(1, ceil(width / 2)), max(1, ceil(height / 2))), Image.LANCZOS)
+    with open(join(directory, 'tiles.dzi'), 'w') as descriptor:
+        descriptor.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                         '<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" '
+                         f'Format="jpg" Overlap="{tile_overlap}" TileSize="{tile_size}">'
+                         f'<Size Width="{image.width}" Height="{image.height}"/></Image>\n')
+    return 'tiles.dzi'
+
+
+def build_image(image_name: str) -> Dict[str, object]:
+    """
+    Build the derivatives of an image, and describe them
+        in an index.json file next to them for VSIG.py.
+
+    :param image_name: Name of the image in media/.
+    :return: Description of the derivatives.
+    """
+    directory = derived_directory(image_name)
+    Path(directory).mkdir(parents=True, exist_ok=True)
+    with Image.open(join(media_path, image_name)) as source:
+        image = source.convert('RGB')
+    derivatives: Dict[str, object] = {"width": image.width, "height": image.height, "widths": [], "tiles": None}
+    for width in widths:
+        if width >= image.width:
+            break
+        save_jpeg(resize_to_width(image, width), join(directory, f'w{width}.jpg'))
+        derivatives["widths"].append(width)
+    save_jpeg(resize_to_width(image, min(thumbnail_width, image.width)), join(directory, 'thumbnail.jpg'))
+    derivatives["thumbnail"] = 'thumbnail.jpg'
+    if ',' in image_name or image.width > foldout_width:  # Names of multi-folio images list their folios.
+        derivatives["tiles"] = build_tiles(image, directory)
+    with open(join(directory, 'index.json'), 'w') as fp:
+        dump(derivatives, fp)
+    return derivatives
+
+
+def build_media(image_names: List[str], jobs: int = 1, force: bool = False) -> None:
+    """
+    Build the derivatives of the images whose contents changed
+        since the last build.
+
+    :param image_names: Names of the images in media/.
+    :param jobs: Number of worker processes.
+    :param force: Build every image, even if it did not change.
+    """
+    build_manifest = load_manifest()
+    media_manifest = build_manifest.setdefault('media', {})
+    hashes = {name: hash_inputs(hash_file(join(media_path, name)), settings) for name in image_names}
+    changed = [name for name in image_names if force or media_manifest.get(name) != hashes[name]
+               or not exists(join(derived_directory(name), 'index.json'))]
+    try:
+        with ProcessPoolExecutor(max(1, jobs)) as executor:
+            for name, _ in zip(changed, executor.map(build_image, changed)):
+                media_manifest[name] = hashes[name]
+                print(f'Built {name}.')
+    finally:  # Keep the images that were built even if one of them fails.
+        save_manifest(build_manifest)
+
+
+if __name__ == '__main__':
+    program = ArgumentParser(description="Build thumbnails, responsive widths and deep zoom tiles of the folio images.")
+    program.add_argument("--jobs", "-j", type=int, default=1, help="Number of processes to build images with.")
+    program.add_argument("--force", action="store_true", help="Build every image, even if it did not change.")
+    args = program.parse_args()
+    image_names = [name for name in listdir(media_path) if name.endswith('.jpg')]
+    if isdir(join(media_path, 'crops')):  # Folios cropped out of multi-folio images by folio_split.py.
+        image_names += ['crops/' + name for name in listdir(join(media_path, 'crops')) if name.endswith('.jpg')]
+    build_media(image_names, args.jobs, args.force)
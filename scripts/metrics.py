@@ -0,0 +1,257 @@
+"""
+Metrics of a build, parser.py and VSIG.py time their stages, count
+    the rows and pages they write and time their SQLite3 queries when
+    they are asked to record metrics, so that slow builds can be
+    explained and build budgets can be checked. Nothing is recorded
+    otherwise, and the helpers below cost next to nothing.
+"""
+import sqlite3 as sql
+from contextlib import contextmanager
+from cProfile import Profile
+from json import dump
+from pstats import Stats
+from resource import getrusage, RUSAGE_CHILDREN
+from time import perf_counter, process_time
+from typing import Callable, Dict, Iterator, List, Optional, TextIO, Tuple
+
+recording = False
+profiling = False
+stages: Dict[str, Dict[str, object]] = {}  # Stage -> measurements, in the order the stages first ran.
+profiles: Dict[str, Profile] = {}
+counters: Dict[str, int] = {}
+queries: Dict[str, List[float]] = {}  # Statement -> [count, seconds, slowest].
+query_totals = [0, 0.0]  # Count and seconds of every query.
+depth = 0  # Number of stages running, only the outermost ones are profiled.
+
+Recorded = Tuple[Dict[str, int], Dict[str, List[float]]]
+
+
+def start_recording(profile: bool = False) -> None:
+    """
+    Start recording the metrics of this process, forgetting earlier ones.
+
+    :param profile: Also profile each outermost stage with cProfile.
+    """
+    global recording, profiling
+    recording, profiling = True, profile
+    for recorded in (stages, profiles, counters, queries):
+        recorded.clear()
+    query_totals[:] = [0, 0.0]
+
+
+def is_recording() -> bool:
+    """
+    Check if metrics are being recorded.
+
+    :return: True if they are.
+    """
+    return recording
+
+
+def count(name: str, amount: int = 1) -> None:
+    """
+    Add to a counter, such as the number of rows or pages written.
+
+    :param name: Name of the counter.
+    :param amount: Amount to add.
+    """
+    if recording:
+        counters[name] = counters.get(name, 0) + amount
+
+
+def count_written(file: TextIO) -> None:
+    """
+    Count a file that was written, and its size.
+
+    :param file: The file, still open.
+    """
+    if recording:
+        count('files_written')
+        count('bytes_written', file.tell())
+
+
+def record_query(statement: str, seconds: float) -> None:
+    """
+    Record that a query ran.
+
+    :param statement: SQL statement of the query.
+    :param seconds: Seconds it took.
+    """
+    statement = ' '.join(statement.split())
+    record = queries.get(statement)
+    if record is None:
+        queries[statement] = record = [0, 0.0, 0.0]
+    record[0] += 1
+    record[1] += seconds
+    record[2] = max(record[2], seconds)
+    query_totals[0] += 1
+    query_totals[1] += seconds
+
+
+class TimedCursor(sql.Cursor):
+    """
+    A cursor that records its queries, the time of a query is the time
+        it takes to run, not to fetch its rows.
+    """
+    def execute(self, statement, parameters=()):
+        start = perf_counter()
+        try:
+            return super().execute(statement, parameters)
+        finally:
+            record_query(statement, perf_counter() - start)
+
+    def executemany(self, statement, parameters):
+        start = perf_counter()
+        try:
+            return super().executemany(statement, parameters)
+        finally:
+            record_query(statement, perf_counter() - start)
+
+
+class TimedConnection(sql.Connection):
+    """
+    A connection whose cursors record their queries.
+    """
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, statement, parameters=()):
+        return self.cursor().execute(statement, parameters)
+
+    def executemany(self, statement, parameters):
+        return self.cursor().executemany(statement, parameters)
+
+
+def connect(database: str, **kwargs) -> sql.Connection:
+    """
+    Connect to an SQLite3 database, its queries are recorded if metrics are.
+
+    :param database: Database file, of type SQLite3
+    :param kwargs: Other arguments of sqlite3.connect.
+    :return: The connection.
+    """
+    return sql.connect(database, factory=TimedConnection if recording else sql.Connection, **kwargs)
+
+
+def children_cpu_time() -> float:
+    """
+    Get the CPU time of the finished worker processes of this process.
+
+    :return: User and system time, in seconds.
+    """
+    usage = getrusage(RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """
+    Measure a stage of the build, a stage that runs more than once,
+        such as the insertion of each batch, adds up its measurements.
+
+    :param name: Name of the stage.
+    """
+    global depth
+    if not recording:
+        yield
+        return
+    record = stages.setdefault(name, {"calls": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0, "queries": 0,
+                                      "query_seconds": 0.0, "counters": {}})
+    counters_before = dict(counters)
+    queries_before = list(query_totals)
+    profile = profiles.setdefault(name, Profile()) if profiling and depth == 0 else None
+    depth += 1
+    wall, cpu, children_cpu = perf_counter(), process_time(), children_cpu_time()
+    if profile is not None:
+        profile.enable()  # A repeated stage adds to the same profile.
+    try:
+        yield
+    finally:
+        if profile is not None:
+            profile.disable()
+        depth -= 1
+        record["calls"] += 1
+        record["wall_seconds"] += perf_counter() - wall
+        record["cpu_seconds"] += process_time() - cpu + children_cpu_time() - children_cpu
+        record["queries"] += query_totals[0] - queries_before[0]
+        record["query_seconds"] += query_totals[1] - queries_before[1]
+        for counter, value in counters.items():
+            added = value - counters_before.get(counter, 0)
+            if added:
+                record["counters"][counter] = record["counters"].get(counter, 0) + added
+
+
+def call_recorded(record: bool, function: Callable, *args) -> Tuple[object, Optional[Recorded]]:
+    """
+    Call a function in a worker process, and send the metrics it
+        recorded back to the main process.
+
+    :param record: Whether the main process records metrics.
+    :param function: Function to call.
+    :param args: Arguments of the function.
+    :return: Result of the function, and its counters and queries if recorded.
+    """
+    if not record:
+        return function(*args), None
+    start_recording()  # Forked workers inherit the metrics of the main process.
+    result = function(*args)
+    return result, (dict(counters), dict(queries))
+
+
+def merge_recorded(recorded: Optional[Recorded]) -> None:
+    """
+    Add the counters and queries a worker process recorded to the ones of this process.
+
+    :param recorded: Counters and queries sent by call_recorded.
+    """
+    if recorded is None:
+        return
+    worker_counters, worker_queries = recorded
+    for name, amount in worker_counters.items():
+        count(name, amount)
+    for statement, (calls, seconds, slowest) in worker_queries.items():
+        record = queries.setdefault(statement, [0, 0.0, 0.0])
+        record[0] += calls
+        record[1] += seconds
+        record[2] = max(record[2], slowest)
+        query_totals[0] += calls
+        query_totals[1] += seconds
+
+
+def save_metrics(path: str) -> None:
+    """
+    Save the metrics as JSON.
+
+    :param path: File to save the metrics to.
+    """
+    with open(path, 'w') as fp:
+        dump({"stages": stages, "counters": counters,
+              "queries": {statement: {"count": calls, "seconds": seconds, "slowest": slowest}
+                          for statement, (calls, seconds, slowest) in queries.items()}}, fp, indent=1)
+
+
+def print_metrics() -> None:
+    """
+    Print a summary of the metrics, one line per stage.
+    """
+    for name, record in stages.items():
+        counted = ', '.join(f'{counter}={value}' for counter, value in record["counters"].items())
+        print(f'{name}: {record["wall_seconds"]:.3f}s wall, {record["cpu_seconds"]:.3f}s cpu, '
+              f'{record["queries"]} queries in {record["query_seconds"]:.3f}s' + (f', {counted}' if counted else ''))
+
+
+def dump_profile(path: str, lines: int = 20) -> Optional[str]:
+    """
+    Save the profile of the stage that took the longest, and print its hottest functions.
+
+    :param path: File to save the profile to, for pstats or snakeviz.
+    :param lines: Number of functions to print.
+    :return: Name of the stage, None if no stage was profiled.
+    """
+    if not profiles:
+        return None
+    hottest = max(profiles, key=lambda name: stages[name]["wall_seconds"])
+    profiles[hottest].dump_stats(path)
+    print(f'Profile of {hottest} saved to {path}:')
+    Stats(path).sort_stats('cumulative').print_stats(lines)
+    return hottest
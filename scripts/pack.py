@@ -0,0 +1,163 @@
+"""
+The generated site packed into a single indexed file, so that a deploy
+    copies one file rather than thousands of small pages. Text files are
+    stored gzip compressed, as a server can send them to browsers without
+    decompressing them, identical files are stored once, and the index
+    at the end of the pack maps the path of each file to its bytes:
+
+        magic, index offset, index length | file bytes ... | index as JSON
+
+    Files that did not change since the previous pack are copied from it
+    rather than compressed again. Run from the root of the repository,
+    like VSIG.py.
+"""
+import gzip
+from argparse import ArgumentParser
+from hashlib import sha1
+from json import dumps, loads
+from mmap import mmap, ACCESS_READ
+from os import replace, stat, walk
+from os.path import exists, isdir, join, splitext
+from struct import Struct
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+header = Struct('<8sQQ')  # Magic, offset and length of the index.
+magic = b'VSIGPAK1'
+site_paths = ['index.html', 'about', 'folio', 'word', 'search', 'stats', 'styles', 'scripts', 'media']
+packed_extensions = {'.html', '.css', '.js', '.json', '.ttf', '.jpg', '.png', '.dzi'}
+compressed_extensions = {'.html', '.css', '.js', '.json', '.ttf', '.dzi'}  # Images are compressed already.
+
+
+class Entry(NamedTuple):
+    """
+    Where a file is in the pack.
+    """
+    offset: int
+    length: int
+    encoding: str  # 'gzip' if the bytes are compressed, '' otherwise.
+    etag: str  # Hash of the uncompressed file.
+
+
+def site_files(paths: Iterable[str]) -> Iterator[str]:
+    """
+    Find the files of the site under the paths, in a stable order.
+
+    :param paths: Files and directories, relative to the root of the site.
+    :return: A generator of the paths of the files, with / as the separator.
+    """
+    for path in paths:
+        if isdir(path):
+            for directory, directories, files in walk(path):
+                directories.sort()
+                for name in sorted(files):
+                    if splitext(name)[1] in packed_extensions:
+                        yield join(directory, name).replace('\\', '/')
+        elif exists(path):
+            yield path
+
+
+class PackReader:
+    """
+    A pack memory-mapped for reading, the bytes of a file are a view of the
+        map, so they are read from the page cache of the system.
+    """
+    def __init__(self, path: str):
+        """
+        :param path: Path of the pack.
+        """
+        self.path = path
+        with open(path, 'rb') as file:
+            self.map = mmap(file.fileno(), 0, access=ACCESS_READ)
+        file_magic, index_offset, index_length = header.unpack_from(self.map)
+        if file_magic != magic:
+            raise ValueError(f'{path} is not a pack.')
+        index = loads(self.map[index_offset:index_offset + index_length])
+        self.entries: Dict[str, Entry] = {name: Entry(*entry) for name, entry in index.items()}
+
+    def read(self, name: str) -> Optional[Tuple[Entry, memoryview]]:
+        """
+        Get a file as it is stored.
+
+        :param name: Path of the file, relative to the root of the site.
+        :return: Where the file is and its stored bytes, None if it is not in the pack.
+        """
+        entry = self.entries.get(name)
+        if entry is None:
+            return None
+        return entry, memoryview(self.map)[entry.offset:entry.offset + entry.length]
+
+    def close(self) -> None:
+        self.map.close()
+
+
+def write_pack(path: str, files: Iterable[str], previous: Optional[PackReader] = None) -> Tuple[int, int]:
+    """
+    Pack the files, the pack is written next to the old one and replaces
+        it once it is complete, so that it can be served meanwhile.
+
+    :param path: Path of the pack.
+    :param files: Paths of the files, relative to the root of the site.
+    :param previous: The previous pack, whose unchanged files are copied.
+    :return: Number of files packed, and number of them that were compressed again.
+    """
+    index: Dict[str, Entry] = {}
+    stored: Dict[str, Tuple[int, int]] = {}  # Hash of the stored bytes -> offset and length.
+    compressed = 0
+    with open(path + '.tmp', 'wb') as pack:
+        pack.write(header.pack(magic, 0, 0))
+        for name in files:
+            with open(name, 'rb') as file:
+                contents = file.read()
+            etag = sha1(contents).hexdigest()
+            old = previous and previous.read(name)
+            if old and old[0].etag == etag:
+                encoding, data = old[0].encoding, old[1]
+            elif splitext(name)[1] in compressed_extensions:
+                encoding, data = 'gzip', gzip.compress(contents, 9, mtime=0)
+                compressed += 1
+            else:
+                encoding, data = '', contents
+            data_hash = sha1(data).hexdigest()
+            if data_hash not in stored:
+                stored[data_hash] = (pack.tell(), len(data))
+                pack.write(data)
+            index[name] = Entry(*stored[data_hash], encoding, etag)
+        index_offset = pack.tell()
+        index_bytes = dumps(index, separators=(',', ':')).encode()
+        pack.write(index_bytes)
+        pack.seek(0)
+        pack.write(header.pack(magic, index_offset, len(index_bytes)))
+    replace(path + '.tmp', path)
+    return len(index), compressed
+
+
+def pack_site(path: str, paths: List[str] = site_paths) -> Tuple[int, int]:
+    """
+    Pack the files of the site, reusing what did not change since the last pack.
+
+    :param path: Path of the pack.
+    :param paths: Files and directories of the site to pack.
+    :return: Number of files packed, and number of them that were compressed again.
+    """
+    previous = None
+    if exists(path):
+        try:
+            previous = PackReader(path)
+        except ValueError:
+            pass
+    try:
+        return write_pack(path, site_files(paths), previous)
+    finally:
+        if previous is not None:
+            previous.close()
+
+
+if __name__ == '__main__':
+    program = ArgumentParser(description="Pack the generated site into a single file, see pack_server.py.")
+    program.add_argument("output", help="Path of the pack.")
+    program.add_argument("--no_media", action="store_true",
+                         help="Leave the images in media/ out, for a site whose images are served from elsewhere.")
+    args = program.parse_args()
+    packed, compressed = pack_site(args.output, [path for path in site_paths if not args.no_media or path != 'media'])
+    print(f"Packed {packed} files into {args.output}, {compressed} of them compressed, "
+          f"{stat(args.output).st_size} bytes.")
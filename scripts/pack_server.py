@@ -0,0 +1,115 @@
+"""
+A small server for a site packed by pack.py, the files are sent
+    straight from the memory-mapped pack, compressed as they are stored
+    to the browsers that accept gzip. The pack is mapped again when it
+    is replaced, such as by VSIG.py --pack.
+"""
+import gzip
+from argparse import ArgumentParser
+from functools import partial
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from mimetypes import guess_type
+from os import stat
+from threading import Lock
+from typing import Optional, Tuple
+from urllib.parse import unquote, urlsplit
+from pack import PackReader
+
+media_max_age = 24 * 60 * 60  # Images change rarely, and are checked again after a day.
+
+
+class Pack:
+    """
+    The pack being served, mapped again when its file changes.
+    """
+    def __init__(self, path: str):
+        """
+        :param path: Path of the pack.
+        """
+        self.path = path
+        self.lock = Lock()
+        self.version: Optional[Tuple[int, int, int]] = None
+        self.reader: Optional[PackReader] = None
+
+    def get(self) -> PackReader:
+        """
+        Get the reader of the current pack.
+
+        :return: The reader.
+        """
+        status = stat(self.path)
+        version = (status.st_ino, status.st_size, status.st_mtime_ns)
+        with self.lock:
+            if version != self.version:
+                self.reader = PackReader(self.path)  # The old map is freed once no response uses it.
+                self.version = version
+            return self.reader
+
+
+class PackHandler(BaseHTTPRequestHandler):
+    """
+    Serves the files of a pack, directories are served by their index.html.
+    """
+    def __init__(self, *args, pack: Pack, **kwargs):
+        self.pack = pack
+        super().__init__(*args, **kwargs)
+
+    def send_file(self, head_only: bool) -> None:
+        """
+        Send the file of the requested path.
+
+        :param head_only: Send only the headers.
+        """
+        name = unquote(urlsplit(self.path).path).lstrip('/')
+        if name == '' or name.endswith('/'):
+            name += 'index.html'
+        stored = self.pack.get().read(name)
+        if stored is None:
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+        entry, data = stored
+        encoding = entry.encoding
+        decompress = encoding == 'gzip' and 'gzip' not in self.headers.get('Accept-Encoding', '')
+        if decompress:
+            encoding = ''
+        etag = f'"{entry.etag}-gz"' if encoding == 'gzip' else f'"{entry.etag}"'  # Each body has its own tag.
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header('ETag', etag)
+            self.send_header('Vary', 'Accept-Encoding')
+            self.end_headers()
+            return
+        if decompress:
+            data = gzip.decompress(data)
+        content_type = guess_type(name)[0] or 'application/octet-stream'
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-Type', content_type + ('; charset=utf-8' if content_type.startswith('text/') else ''))
+        self.send_header('Content-Length', str(len(data)))
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', f'public, max-age={media_max_age}' if name.startswith('media/')
+                         else 'no-cache')
+        self.end_headers()
+        if not head_only:
+            self.wfile.write(data)
+
+    def do_GET(self):
+        self.send_file(False)
+
+    def do_HEAD(self):
+        self.send_file(True)
+
+
+if __name__ == '__main__':
+    program = ArgumentParser(description="Serve a site packed by pack.py.")
+    program.add_argument("input", help="Path of the pack.")
+    program.add_argument("--port", "-p", type=int, default=8000, help="Port to listen on.")
+    program.add_argument("--bind", "-b", default="127.0.0.1", help="Address to listen on.")
+    args = program.parse_args()
+    handler = partial(PackHandler, pack=Pack(args.input))
+    with ThreadingHTTPServer((args.bind, args.port), handler) as server:
+        print(f"Serving {args.input} at http://{args.bind}:{args.port}/index.html")
+        server.serve_forever()
@@ -1,18 +1,58 @@
 import re
 import sqlite3 as sql
-from typing import List, Dict, Iterable, Tuple
+from typing import List, Dict, Iterable, Iterator, NamedTuple, Optional, Set, TextIO, Tuple
 from argparse import ArgumentParser
+from itertools import groupby
+from operator import attrgetter
 from os import remove
-from os.path import exists
-from dataclasses import dataclass
+from os.path import exists, getsize
+from struct import Struct, pack
+from warnings import warn
+from manifest import load_manifest, save_manifest, hash_inputs, hash_file
+from metrics import connect, count, stage, start_recording, save_metrics, print_metrics, dump_profile
+from variants import insert_variants
 
-@dataclass
-class Appearances:
+folio_pattern = re.compile(r'<(f\d+[vr]\d*)>(.*)')  # Page headers, such as <f1r>
+locus_pattern = re.compile(r'<(f\d+[vr]\d*)\.([^;>]+)(?:;(\w+))?>(.*)')  # Loci, such as <f1r.P.1;H>
+language_pattern = re.compile(r'\$L=(\w)')  # Currier language in a page header, such as <! $I=H $L=A $H=1>
+unknown_transcriber = '?'  # Transcriber of the lines without a transcriber code.
+position = Struct('<II')  # Line number and token offset of an appearance, as packed in Appears.positions.
+
+
+class Record(NamedTuple):
+    """
+    A single line of the transcription, records without a locus
+        are page headers and hold the rest of the header line as text.
+    """
+    folio: str
+    locus: Optional[str]
+    transcriber: Optional[str]
+    text: str
+
+
+class Posting(NamedTuple):
     """
-    Words and the folios they appear in a parallel list structure.
+    A single word's appearances in a folio, the line number
+        and the token offset denote its first appearance.
     """
-    words: List[str]
-    folios: List[List[str]]
+    folio: str
+    line: int
+    offset: int
+    count: int
+    positions: bytes  # Line number and token offset of every appearance, in order, see unpack_positions.
+
+
+def unpack_positions(positions: bytes) -> List[Tuple[int, int]]:
+    """
+    Unpack the positions of the appearances of a word in a folio.
+
+    :param positions: Packed positions, as in Appears.positions.
+    :return: Line number, token offset pairs, in the order of the lines.
+    """
+    return list(position.iter_unpack(positions))
+
+
+InvertedIndex = Dict[str, List[Posting]]  # Word -> postings in the order of folios.
 
 
 def sqlite_create_tables(output_file: str) -> None:
@@ -23,145 +63,297 @@ def sqlite_create_tables(output_file: str) -> None:
     """
     with open("setup.sql") as sql_commands:
         setup_commands = sql_commands.read()
-    with sql.connect(output_file) as db:
+    with connect(output_file) as db:
         cursor = db.cursor()
         cursor.executescript(setup_commands)
         db.commit()
 
 
-def insert_folios(folios: Iterable[str], db_cursor: sql.Cursor) -> None:
+class Identifiers:
     """
-    Insert the folios to the database.
-
-    :param folios: An iterable of folios, folio names or title pages.
-    :param db_cursor: An SQLite3 cursor.
+    Integer IDs of the names in a table, such as the words, names
+        that are not in the table yet are given the next IDs, and are
+        inserted with the next batch.
     """
-    db_cursor.executemany("INSERT INTO Folio(folioName) VALUES(?)",
-                          list(map(lambda x: (x, ), list(folios))))
+    def __init__(self, cursor: sql.Cursor, table: str, id_column: str, name_column: str):
+        """
+        Load the IDs that are already in the table.
+
+        :param cursor: Cursor to the database.
+        :param table: Name of the table.
+        :param id_column: Column of the IDs.
+        :param name_column: Column of the names.
+        """
+        self.insert_command = f"INSERT INTO {table}({id_column}, {name_column}) VALUES(?, ?)"
+        self.ids: Dict[str, int] = dict(cursor.execute(f"SELECT {name_column}, {id_column} FROM {table}"))
+        self.next_id = max(self.ids.values(), default=0) + 1
+        self.new: List[Tuple[int, str]] = []
+
+    def get(self, name: str) -> int:
+        """
+        Get the ID of a name, giving it the next ID if it is new.
+
+        :param name: The name.
+        :return: ID of the name.
+        """
+        id_ = self.ids.get(name)
+        if id_ is None:
+            id_ = self.ids[name] = self.next_id
+            self.next_id += 1
+            self.new.append((id_, name))
+        return id_
+
+    def insert_new(self, cursor: sql.Cursor) -> int:
+        """
+        Insert the names that were given IDs since the last insertion.
+
+        :param cursor: Cursor to the database.
+        :return: Number of names inserted.
+        """
+        cursor.executemany(self.insert_command, self.new)
+        inserted, self.new = len(self.new), []
+        return inserted
+
+
+class Keys(NamedTuple):
+    """
+    IDs of the folios, words and transcribers.
+    """
+    folios: Identifiers
+    words: Identifiers
+    transcribers: Identifiers
+
+
+Transcriptions = Dict[str, Dict[str, List[Record]]]  # Transcriber -> folio -> lines of the folio.
 
 
-def insert_paragraphs(folios_data: Dict[str, List[str]], db_cursor: sql.Cursor) -> None:
+class Loaded(NamedTuple):
     """
-    Insert the paragraphs to the database including their relations to
-        folio pages.
-    
-    :param folios_data: Data belonging to folios.
-    :param db_file: Filename of the SQLite3 database.
+    What a load changed, for the stages that follow it.
     """
-    for folio_name in folios_data:
-        folio_data = folios_data[folio_name]
-        tuples = map(lambda x: (folio_name, x), folio_data)
-        # This generates folio_name, paragraph tuples
-        db_cursor.executemany(f"INSERT INTO Paragraph(folioName, paragraph) VALUES(?, ?)", list(tuples))
+    transcribers: List[str]  # Names of the transcribers that were loaded.
+    new_words: List[str]  # Words that were not in the database before.
 
 
-def insert_words(words: List[str], cursor: sql.Cursor) -> None:
+def insert_paragraphs(transcription: Dict[str, List[Record]], transcriber_id: int, keys: Keys,
+                      db_cursor: sql.Cursor) -> int:
     """
-    Insert the words into the SQLite3 database.
+    Insert the lines of a transcriber to the database including their
+        relations to folio pages.
 
-    :param words: Words that appear in the manuscript.
-    :param cursor: Cursor for the SQLite3 database.
+    :param transcription: Folio -> lines of the folio pairs.
+    :param transcriber_id: ID of the transcriber of the lines.
+    :param keys: IDs of the folios.
+    :param db_cursor: An SQLite3 cursor.
+    :return: Number of lines inserted.
     """
-    cursor.executemany("INSERT INTO Word(wordName) VALUES(?)", [*map(lambda x: (x, ), words), ])
+    rows = [(transcriber_id, keys.folios.get(folio_name), record.locus, record.text)
+            for folio_name, records in transcription.items() for record in records]
+    db_cursor.executemany("INSERT INTO Paragraph(transcriberID, folioID, locus, paragraph) VALUES(?, ?, ?, ?)", rows)
+    return len(rows)
 
 
-def insert_appearances(appearances: Appearances, cursor: sql.Cursor) -> None:
+def insert_appearances(index: InvertedIndex, transcriber_id: int, keys: Keys, cursor: sql.Cursor) -> int:
     """
-    Insert the appearances to the database.
+    Insert the appearances of a transcriber to the database, a folio
+        that is split in the transcription adds up its counts.
 
-    :param appearances: Appearances data class holds the data about the appearances.
+    :param index: Inverted index holding the postings of each word.
+    :param transcriber_id: ID of the transcriber of the postings.
+    :param keys: IDs of the folios and the words.
     :param cursor: Cursor for the database.
+    :return: Number of appearances inserted.
     """
-    appears = []
-    for i, word in enumerate(appearances.words):
-        appears.extend([*map(lambda folio: (word, folio), appearances.folios[i])])
-    cursor.executemany("INSERT INTO Appears(wordName, folioName) VALUES(?, ?)", appears)
+    rows = [(transcriber_id, keys.words.get(word), keys.folios.get(posting.folio), posting.line, posting.offset,
+             posting.count, posting.positions) for word, postings in index.items() for posting in postings]
+    cursor.executemany("INSERT INTO Appears(transcriberID, wordID, folioID, lineNumber, tokenOffset, occurrenceCount, "
+                       "positions) VALUES(?, ?, ?, ?, ?, ?, ?) ON CONFLICT DO UPDATE "
+                       "SET occurrenceCount = occurrenceCount + excluded.occurrenceCount, "
+                       "positions = positions || excluded.positions", rows)
+    return len(rows)
 
 
-def insert_values(folios_data: Dict[str, List[str]], db_file: str, appearances) -> None:
+def delete_transcription(transcriber_id: int, cursor: sql.Cursor) -> None:
     """
-    Insert the values into the SQLite3 database file.
+    Delete what was loaded of a transcriber before, so that it can be
+        loaded again without touching the other transcribers.
 
-    :param appearances: Appearances data object.
-    :param folios_data: Data containing folio number, folio content
-        pairs.
-    :param db_file: Name of the database file.
+    :param transcriber_id: ID of the transcriber.
+    :param cursor: Cursor for the database.
     """
-    with sql.connect(db_file) as db:
-        cursor = db.cursor()
-        cursor.execute("PRAGMA synchronous = OFF")  # Remove data protections.
-        cursor.execute("PRAGMA journal_mode = MEMORY")  # For faster handling.
-        insert_folios(folios_data.keys(), cursor)
-        db.commit()
-        insert_paragraphs(folios_data, cursor)
-        db.commit()
-        insert_words(appearances.words, cursor)
-        db.commit()
-        insert_appearances(appearances, cursor)
-        db.commit()
+    cursor.execute("DELETE FROM SimilarParagraph WHERE paragraphID IN "
+                   "(SELECT paragraphID FROM Paragraph WHERE transcriberID = ?)", (transcriber_id,))
+    cursor.execute("DELETE FROM Similar WHERE transcriberID = ?", (transcriber_id,))
+    cursor.execute("DELETE FROM Statistics WHERE transcriberID = ?", (transcriber_id,))
+    cursor.execute("DELETE FROM Paragraph WHERE transcriberID = ?", (transcriber_id,))
+    cursor.execute("DELETE FROM Appears WHERE transcriberID = ?", (transcriber_id,))
 
 
-def parse_folio_num(folio_tag: str) -> str:
+def remove_unused_words(cursor: sql.Cursor) -> None:
     """
-    Parse a folio number from a folio tag.
+    Remove the words no transcriber uses anymore, and their alternate forms.
 
-    :param folio_tag Tag of the folio.
-    :return the name of the folio.
+    :param cursor: Cursor for the database.
     """
-    return folio_tag.replace('<', '').replace('>', '')
+    cursor.execute("DELETE FROM Word WHERE wordID NOT IN (SELECT wordID FROM Appears)")
+    cursor.execute("DELETE FROM Variant WHERE wordID NOT IN (SELECT wordID FROM Word) "
+                   "OR variantID NOT IN (SELECT wordID FROM Word)")
 
 
-def clean_contents(folio_text: str) -> List[str]:
+def insert_values(transcriptions: Transcriptions, indexes: Dict[str, InvertedIndex], keys: Keys,
+                  reloaded: Set[int], db: sql.Connection) -> None:
     """
-    Clean the contents of a folio.
+    Insert a batch of values into the SQLite3 database and commit them.
+
+    :param transcriptions: Lines of the batch, by transcriber and folio.
+    :param indexes: Inverted indices of the word appearances in the
+        batch, by transcriber.
+    :param keys: IDs of the folios, words and transcribers, the new
+        ones are inserted.
+    :param reloaded: IDs of the transcribers whose old lines were
+        deleted by the previous batches, updated with the ones of this batch.
+    :param db: Connection to the SQLite3 database.
+    """
+    cursor = db.cursor()
+    count('folio_rows', keys.folios.insert_new(cursor))
+    for transcriber_name, transcription in transcriptions.items():
+        transcriber_id = keys.transcribers.get(transcriber_name)
+        keys.transcribers.insert_new(cursor)
+        if transcriber_id not in reloaded:
+            delete_transcription(transcriber_id, cursor)
+            reloaded.add(transcriber_id)
+        index = indexes.get(transcriber_name, {})
+        for word in index:
+            keys.words.get(word)
+        count('word_rows', keys.words.insert_new(cursor))
+        count('paragraph_rows', insert_paragraphs(transcription, transcriber_id, keys, cursor))
+        count('appearance_rows', insert_appearances(index, transcriber_id, keys, cursor))
+    db.commit()
+
+
+def get_transcriber_id(cursor: sql.Cursor, transcriber: Optional[str] = None) -> int:
+    """
+    Get the ID of the transcriber whose transcription the site shows.
 
-    :param folio_text: Text of a folio.
-    :return The cleaned contents of a folio.
+    :param cursor: Cursor to the database.
+    :param transcriber: Name of the transcriber, the first one
+        loaded into the database if not given.
+    :return: ID of the transcriber.
     """
-    cleaned_paragraphs = re.findall(r"((?<=>)\s*.+[\n|\w])", folio_text)  # Not all are actually paragraphs.
-    return list(filter(lambda x: x != '', map(lambda x: x.strip(), cleaned_paragraphs)))
+    if transcriber is None:
+        return cursor.execute("SELECT ifnull(min(transcriberID), 0) FROM Transcriber").fetchone()[0]
+    row = cursor.execute("SELECT transcriberID FROM Transcriber WHERE transcriberName = ?", (transcriber,)).fetchone()
+    if row is None:
+        raise ValueError(f'There is no transcriber {transcriber} in the database.')
+    return row[0]
 
 
-def parse_word_appearances(cleaned_contents: List[str], appearances: Appearances, folio_name) -> None:
+def read_records(file: TextIO) -> Iterator[Record]:
     """
-    Parse the word appearance count and append the word appearances accordingly.
+    Read a file in the Interim Voynich Format line by line.
 
-    :param cleaned_contents: Contents of a folio.
-    :param appearances: Appearances dataclass.
-    :param folio_name: Name of the folio that is parsed.
+    :param file: An open transcription file.
+    :return: A generator of the records in the file, in file order.
     """
-    words = ('.'.join(cleaned_contents)).split('.')
-    unique_words = list(set(words))
-    while len(unique_words) > 0:
-        word = unique_words.pop()  # Get a word.
-        try:
-            word_index = appearances.words.index(word)  # Check if the word appeared in the index before.
-            appearances.folios[word_index].append(folio_name)  # Denote that the word that exists
-            # Also appears in this folio.
-        except ValueError: # If the word does not exists.
-            appearances.words.append(word)  # Add the word.
-            appearances.folios.append([folio_name, ])  # And denote it appears in this folio.
-
+    for line in file:
+        if not line.startswith('<'):  # Comments and blank lines.
+            continue
+        match = locus_pattern.match(line)
+        if match is not None:
+            folio_name, locus, transcriber, text = match.groups()
+            text = text.strip()
+            if text:
+                yield Record(folio_name, locus, transcriber, text)
+            continue
+        match = folio_pattern.match(line)
+        if match is not None:
+            yield Record(match.group(1), None, None, match.group(2).strip())
+
+
+def parse_word_appearances(cleaned_contents: List[str], index: InvertedIndex, folio_name: str) -> None:
+    """
+    Parse the word appearances of a folio and add their postings to the index.
 
-def split_folios(full_text: str, appearances: Appearances) -> Dict[str, List[str]]:
+    :param cleaned_contents: Contents of a folio, one line per element.
+    :param index: Inverted index to add the postings to.
+    :param folio_name: Name of the folio that is parsed.
+    """
+    folio_postings: Dict[str, List[int]] = {}  # Word -> line, offset of each appearance in this folio, flattened.
+    for line_number, line in enumerate(cleaned_contents, 1):
+        for offset, word in enumerate(line.split('.')):
+            posting = folio_postings.get(word)
+            if posting is None:
+                folio_postings[word] = [line_number, offset]
+            else:
+                posting += line_number, offset
+    for word, positions in folio_postings.items():
+        postings = index.get(word)
+        if postings is None:
+            index[word] = postings = []
+        postings.append(Posting(folio_name, positions[0], positions[1], len(positions) // 2,
+                                pack(f'<{len(positions)}I', *positions)))
+
+
+def ingest(records: Iterable[Record], db_file: str, batch_size: int = 1000,
+           transcriber: Optional[str] = None, input_hash: Optional[str] = None) -> Loaded:
     """
-    Split the full text into a list of strings
-        each containing text belonging to a folio.
+    Insert the records into the SQLite3 database file, folio by folio,
+        in batches of roughly batch_size lines. The lines of each
+        transcriber replace the ones loaded from an earlier transcription,
+        the other transcribers are left as they are.
 
-    :param full_text: Full text of the voynich manuscript.
-    :param appearances: Appearances dataclass to hold which word appears where.
-    :return a list of page transliterations.
+    :param records: Records of the transcription, in file order.
+    :param db_file: Name of the database file.
+    :param batch_size: Number of lines to hold in memory before inserting them.
+    :param transcriber: If given, only the lines by this transcriber are inserted.
+    :param input_hash: Hash of the transcription, saved for the transcribers loaded from it.
+    :return: The transcribers that were loaded, and the words that are new.
     """
-    all_split = re.split(r"(<f\d+(?:v|r)\d*>)", full_text)[1:]
-    folios = {}  # The cleaned and semi-parsed folios list
-    for i in range(0, len(all_split), 2):
-        # Clean the contents of the folio and parse them to
-        # Nice lists.
-        cleaned_contents = clean_contents(all_split[i+1])
-        folio_name = parse_folio_num(all_split[i])
-        folios[folio_name] = cleaned_contents
-        parse_word_appearances(cleaned_contents, appearances, folio_name)
-    return folios
+    with connect(db_file) as db:
+        db.execute("PRAGMA synchronous = OFF")  # Remove data protections.
+        db.execute("PRAGMA journal_mode = MEMORY")  # For faster handling.
+        cursor = db.cursor()
+        keys = Keys(Identifiers(cursor, 'Folio', 'folioID', 'folioName'),
+                    Identifiers(cursor, 'Word', 'wordID', 'wordName'),
+                    Identifiers(cursor, 'Transcriber', 'transcriberID', 'transcriberName'))
+        reloaded: Set[int] = set()
+        known_words = set(keys.words.ids)
+        languages: List[Tuple[str, int]] = []  # Language, folio ID pairs from the page headers.
+        transcriptions: Transcriptions = {}
+        indexes: Dict[str, InvertedIndex] = {}
+        pending = 0  # Lines waiting to be inserted.
+        for folio_name, folio_records in groupby(records, key=attrgetter('folio')):
+            keys.folios.get(folio_name)  # Folios without lines have pages too.
+            lines: Dict[str, List[Record]] = {}
+            for record in folio_records:
+                if record.locus is None:
+                    language = language_pattern.search(record.text)
+                    if language is not None:
+                        languages.append((language.group(1), keys.folios.get(folio_name)))
+                elif transcriber is None or record.transcriber == transcriber:
+                    lines.setdefault(record.transcriber or unknown_transcriber, []).append(record)
+            for transcriber_name, transcriber_lines in lines.items():
+                transcriptions.setdefault(transcriber_name, {}).setdefault(folio_name, []).extend(transcriber_lines)
+                with stage('parse'):
+                    parse_word_appearances([record.text for record in transcriber_lines],
+                                           indexes.setdefault(transcriber_name, {}), folio_name)
+                pending += len(transcriber_lines)
+            if pending >= batch_size:
+                with stage('insert'):
+                    insert_values(transcriptions, indexes, keys, reloaded, db)
+                transcriptions, indexes, pending = {}, {}, 0
+        with stage('insert'):
+            insert_values(transcriptions, indexes, keys, reloaded, db)
+            remove_unused_words(cursor)
+            cursor.executemany("UPDATE Folio SET language = ? WHERE folioID = ?", languages)
+            cursor.executemany("UPDATE Transcriber SET inputHash = ? WHERE transcriberID = ?",
+                               [(input_hash, transcriber_id) for transcriber_id in reloaded])
+            db.commit()
+        with stage('text_index'):
+            cursor.execute("INSERT INTO ParagraphText(ParagraphText) VALUES('rebuild')")
+            db.commit()
+    return Loaded([name for name, transcriber_id in keys.transcribers.ids.items() if transcriber_id in reloaded],
+                  [word for word in keys.words.ids if word not in known_words])
 
 
 if __name__ == '__main__':
@@ -169,14 +361,63 @@ if __name__ == '__main__':
                              description="Parse the Interim Voynich Files to SQLite3 databases.")
     program.add_argument("input", help="Input file in Voynich Interim Format.")
     program.add_argument("output", help="Output file in SQLite3 format.")
-    program.add_argument("--remove_old", "-r",
-                         action="store_true", help="Remove the old output file with the same name if it exists.")
+    program.add_argument("--remove_old", "-r", action="store_true",
+                         help="Remove the old output file with the same name if it exists, rather than replacing "
+                              "only the transcribers of the input in it.")
+    program.add_argument("--transcriber", "-t", help="Only parse the lines of the given transcriber.")
+    program.add_argument("--batch_size", "-b", type=int, default=1000,
+                         help="Number of lines to insert at once.")
+    program.add_argument("--force", action="store_true",
+                         help="Parse the input even if it did not change since the last time it was parsed.")
+    program.add_argument("--metrics", "-m", help="Save the timings, row counts and queries of each stage to this file.")
+    program.add_argument("--profile", nargs='?', const='parser.prof',
+                         help="Profile each stage, and save the profile of the slowest one to this file.")
+    program.add_argument("--tokens", help="Export the token stream of the database as arrays to this directory, "
+                                          "see token_bundle.py.")
     arguments = program.parse_args()
+    if arguments.metrics or arguments.profile:
+        start_recording(arguments.profile is not None)
+    build_manifest = load_manifest()
+    databases = build_manifest.setdefault('databases', {})
+    load = f"{arguments.output} < {arguments.input};{arguments.transcriber or '*'}"  # Each load of a database.
+    input_hash = hash_inputs(hash_file(arguments.input), hash_file("setup.sql"), arguments.transcriber)
+    if (not arguments.force and databases.get(load) == input_hash and exists(arguments.output)
+            and (arguments.tokens is None or exists(arguments.tokens))):
+        print(f"{arguments.input} did not change since it was loaded into {arguments.output}, skipping.")
+        exit(0)
+    # The other loads of the database may have loaded the transcribers this one replaces, so they are loaded
+    # again next time rather than skipped.
+    for other_load in [key for key in databases if key.startswith(f"{arguments.output} < ")]:
+        del databases[other_load]
     if arguments.remove_old and exists(arguments.output):
         remove(arguments.output)
-    sqlite_create_tables(arguments.output)
-    with open(arguments.input) as file:
-        appearances = Appearances([], [])
-        folios = split_folios(file.read(), appearances)
-        insert_values(folios, arguments.output, appearances)
+    with stage('create_tables'):
+        sqlite_create_tables(arguments.output)
+    with stage('ingest'), open(arguments.input) as file:
+        loaded = ingest(read_records(file), arguments.output, arguments.batch_size, arguments.transcriber, input_hash)
+        count('database_bytes', getsize(arguments.output))
+    try:
+        from similarity import insert_similarities  # SciPy is needed only for the similarities.
+    except ImportError as error:
+        warn(f"The similar folios of {', '.join(loaded.transcribers)} were not computed again, run similarity.py once "
+             f"{error.name} is installed.")
+    else:
+        with stage('similarity'):  # Loading a transcriber deletes its similar folios and paragraphs.
+            for transcriber_name in loaded.transcribers:
+                insert_similarities(arguments.output, transcriber=transcriber_name)
+    with stage('variants'):
+        count('new_words', len(loaded.new_words))
+        insert_variants(arguments.output, words=loaded.new_words)
+    if arguments.tokens:
+        from token_bundle import export_tokens  # NumPy is needed only for the export.
+        with stage('tokens'):
+            export_tokens(arguments.output, arguments.tokens)
+    databases[load] = input_hash
+    save_manifest(build_manifest)
+    if arguments.metrics or arguments.profile:
+        print_metrics()
+    if arguments.metrics:
+        save_metrics(arguments.metrics)
+    if arguments.profile:
+        dump_profile(arguments.profile)
 
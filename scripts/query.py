@@ -0,0 +1,139 @@
+"""
+Search the lines of the transcriptions for glyph sequences, a query
+    such as ckh*dy finds the lines where ckh is followed by dy, * stands
+    for any number of characters and ? for a single one. The parts of
+    the query that are three characters or longer are looked up in the
+    trigram index parser.py builds, which ranks the lines, and the lines
+    it finds are then matched against the whole query.
+"""
+import re
+import sqlite3 as sql
+from argparse import ArgumentParser
+from time import perf_counter
+from typing import List, NamedTuple, Optional, Pattern
+from parser import get_transcriber_id
+
+wildcard_pattern: Pattern = re.compile(r'[*?]')
+
+
+class Line(NamedTuple):
+    """
+    A line that matched a query.
+    """
+    folio: str
+    locus: str
+    transcriber: str
+    text: str
+
+
+def glob_pattern(query: str) -> str:
+    """
+    Get the GLOB pattern of a query, a line matches it if it
+        contains the query anywhere.
+
+    :param query: The query, with * and ? as wildcards.
+    :return: The pattern.
+    """
+    return '*' + query.replace('[', '[[]') + '*'  # Brackets are literal, as in [a:o] of the transcriptions.
+
+
+def match_expression(query: str) -> Optional[str]:
+    """
+    Get the full-text query of the parts of a query the trigram index can look up.
+
+    :param query: The query, with * and ? as wildcards.
+    :return: The full-text query, None if every part is shorter than a trigram.
+    """
+    parts = [part for part in wildcard_pattern.split(query) if len(part) >= 3]
+    if not parts:
+        return None
+    return ' AND '.join('"' + part.replace('"', '""') + '"' for part in parts)
+
+
+def highlight_pattern(query: str) -> Pattern:
+    """
+    Get a regular expression that finds the parts of a query in a line.
+
+    :param query: The query, with * and ? as wildcards.
+    :return: The expression, the literal parts of the query are its groups.
+    """
+    expression = ''
+    for part in re.split(r'([*?])', query):
+        if part == '*':
+            expression += '.*?'
+        elif part == '?':
+            expression += '.'
+        elif part:
+            expression += f'({re.escape(part)})'
+    return re.compile(expression)
+
+
+def highlight(text: str, pattern: Pattern, before: str = '[', after: str = ']') -> str:
+    """
+    Mark the parts of the query in the first place a line matches it.
+
+    :param text: The line.
+    :param pattern: Expression of the query, from highlight_pattern.
+    :param before: Text to put before each part.
+    :param after: Text to put after each part.
+    :return: The marked line.
+    """
+    match = pattern.search(text)
+    if match is None:
+        return text
+    marked, last = [], 0
+    for group in range(1, (pattern.groups or 0) + 1):
+        start, end = match.span(group)
+        marked.extend([text[last:start], before, text[start:end], after])
+        last = end
+    marked.append(text[last:])
+    return ''.join(marked)
+
+
+def search_lines(cursor: sql.Cursor, query: str, transcriber_id: Optional[int] = None, limit: int = 50) -> List[Line]:
+    """
+    Find the lines that contain a query, the lines that best match its
+        longer parts come first.
+
+    :param cursor: Cursor to the database.
+    :param query: The query, with * and ? as wildcards.
+    :param transcriber_id: If given, only the lines of this transcriber are searched.
+    :param limit: Maximum number of lines to return.
+    :return: The lines.
+    """
+    expression = match_expression(query)
+    transcriber_filter = "" if transcriber_id is None else "AND Paragraph.transcriberID = :transcriber "
+    if expression is None:  # Too short for the trigrams, every line is matched against the pattern.
+        statement = ("SELECT folioName, locus, transcriberName, Paragraph.paragraph FROM Paragraph "
+                     "JOIN Folio USING (folioID) JOIN Transcriber USING (transcriberID) "
+                     "WHERE Paragraph.paragraph GLOB :pattern " + transcriber_filter +
+                     "ORDER BY paragraphID LIMIT :limit")
+    else:
+        statement = ("SELECT folioName, locus, transcriberName, Paragraph.paragraph FROM ParagraphText "
+                     "JOIN Paragraph ON paragraphID = ParagraphText.rowid "
+                     "JOIN Folio USING (folioID) JOIN Transcriber USING (transcriberID) "
+                     "WHERE ParagraphText MATCH :expression AND ParagraphText.paragraph GLOB :pattern " +
+                     transcriber_filter + "ORDER BY rank LIMIT :limit")
+    cursor.execute(statement, {"expression": expression, "pattern": glob_pattern(query),
+                               "transcriber": transcriber_id, "limit": limit})
+    return [Line(*row) for row in cursor.fetchall()]
+
+
+if __name__ == '__main__':
+    program = ArgumentParser(description="Search the lines of the Voynich Manuscript for glyph sequences.")
+    program.add_argument("input", help="Voynich data in a SQLite3 file")
+    program.add_argument("query", help="Glyphs to search for, * matches any characters and ? a single one, "
+                                       "such as ckh*dy.")
+    program.add_argument("--transcriber", "-t", help="Only search the lines of this transcriber.")
+    program.add_argument("--limit", "-l", type=int, default=50, help="Maximum number of lines to show.")
+    args = program.parse_args()
+    with sql.connect(f'file:{args.input}?mode=ro', uri=True) as db:
+        start = perf_counter()
+        cursor = db.cursor()
+        transcriber_id = None if args.transcriber is None else get_transcriber_id(cursor, args.transcriber)
+        lines = search_lines(cursor, args.query, transcriber_id, args.limit)
+        elapsed = perf_counter() - start
+    pattern = highlight_pattern(args.query)
+    for line in lines:
+        print(f"{line.folio:8} {line.locus:10} {line.transcriber:3} {highlight(line.text, pattern)}")
+    print(f"{len(lines)} lines in {elapsed * 1000:.1f} ms.")
@@ -0,0 +1,126 @@
+/*
+ * Client side word search over the sharded index in search/,
+ * only the shards a query needs are fetched, and each is fetched once.
+ */
+var searchBase = new URL("../search/", document.currentScript.src);
+var searchCache = {};
+var maxResults = 100;
+
+function fetchShard(path) {
+    if (!(path in searchCache)) {
+        searchCache[path] = fetch(new URL(path, searchBase)).then(function (response) {
+            return response.ok ? response.json() : null;
+        });
+    }
+    return searchCache[path];
+}
+
+function shardName(key) {
+    var hex = Array.from(new TextEncoder().encode(key), function (byte) {
+        return byte.toString(16).padStart(2, "0");
+    });
+    return "_" + hex.join("") + ".json";
+}
+
+function longestPrefix(prefixes, word) {
+    var longest = null;
+    prefixes.forEach(function (prefix) {
+        if (word.startsWith(prefix) && (longest === null || prefix.length > longest.length)) {
+            longest = prefix;
+        }
+    });
+    return longest;
+}
+
+function lookupWords(words) {
+    // Get the postings of the given words, [[folio, count], ...] per word.
+    return fetchShard("index.json").then(function (index) {
+        var shards = {};
+        words.forEach(function (word) {
+            shards[longestPrefix(index.prefixes, word)] = true;
+        });
+        return Promise.all(Object.keys(shards).map(function (prefix) {
+            return fetchShard("words/" + shardName(prefix));
+        }));
+    }).then(function (shards) {
+        var postings = {};
+        shards.forEach(function (shard) {
+            words.forEach(function (word) {
+                if (shard && word in shard) {
+                    postings[word] = shard[word];
+                }
+            });
+        });
+        return postings;
+    });
+}
+
+function searchPrefix(query) {
+    // Words that start with the query, and their postings.
+    return fetchShard("index.json").then(function (index) {
+        var prefixes = index.prefixes.filter(function (prefix) {
+            return prefix.startsWith(query);
+        });
+        var longest = longestPrefix(index.prefixes, query);
+        if (longest !== null && prefixes.indexOf(longest) === -1) {
+            prefixes.push(longest);
+        }
+        return Promise.all(prefixes.map(function (prefix) {
+            return fetchShard("words/" + shardName(prefix));
+        }));
+    }).then(function (shards) {
+        var postings = {};
+        shards.forEach(function (shard) {
+            Object.keys(shard || {}).forEach(function (word) {
+                if (word.startsWith(query)) {
+                    postings[word] = shard[word];
+                }
+            });
+        });
+        return postings;
+    });
+}
+
+function searchSubstring(query) {
+    // Words that contain the query, and their postings.
+    if (query.length < 2) {
+        return Promise.resolve({});
+    }
+    return fetchShard("grams/" + shardName(query.slice(0, 3))).then(function (words) {
+        words = (words || []).filter(function (word) {
+            return word.indexOf(query) !== -1;
+        }).sort().slice(0, maxResults);
+        return lookupWords(words);
+    });
+}
+
+function attachSearch(inputId, modeId, resultsId) {
+    var input = document.getElementById(inputId);
+    var mode = document.getElementById(modeId);
+    var results = document.getElementById(resultsId);
+    function update() {
+        var query = input.value.trim();
+        if (query === "") {
+            results.innerHTML = "";
+            return;
+        }
+        var search = mode.value === "substring" ? searchSubstring : searchPrefix;
+        search(query).then(function (postings) {
+            if (input.value.trim() !== query) {
+                return;  // A newer query is on its way.
+            }
+            results.innerHTML = "";
+            Object.keys(postings).sort().slice(0, maxResults).forEach(function (word) {
+                var item = document.createElement("li");
+                var link = document.createElement("a");
+                link.href = encodeURIComponent(word) + ".html";
+                link.textContent = word;
+                item.appendChild(link);
+                item.appendChild(document.createTextNode(" (" + postings[word].length + " folios)"));
+                results.appendChild(item);
+            });
+        });
+    }
+    input.addEventListener("input", update);
+    mode.addEventListener("change", update);
+}
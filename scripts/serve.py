@@ -0,0 +1,259 @@
+"""
+A local server to preview the site, the folio and word pages are
+    rendered from the SQLite3 database when they are requested rather
+    than generated by VSIG.py beforehand, so that a fix to the
+    transcription can be seen as soon as parser.py is run again.
+    Rendered pages are kept in a bounded cache, which is emptied
+    when the database, the templates, equivalents.json or the crops
+    of the folios change.
+    Everything else, such as the media and the styles, is served from
+    the disk. Run from the root of the repository, like VSIG.py.
+"""
+from argparse import ArgumentParser
+from collections import OrderedDict
+from functools import partial
+from hashlib import sha1
+from http import HTTPStatus
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from json import load
+from os import stat
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+import vsig
+from parser import get_transcriber_id
+from template_engine import Template
+
+watched_files = ['templates/folio.html', 'templates/missing_folio.html', 'templates/word.html',
+                 'templates/general_index.html', 'equivalents.json', 'media/crops']  # Crops are added to the directory.
+media_max_age = 24 * 60 * 60  # Images change rarely, and their Last-Modified is checked after a day.
+
+
+class PageCache:
+    """
+    Renders the pages of a database and keeps the most recently
+        used ones, the cache is emptied when its inputs change.
+    """
+    def __init__(self, db_file: str, size: int = 1024, transcriber: Optional[str] = None):
+        """
+        :param db_file: Database file, of type SQLite3
+        :param size: Maximum number of pages to keep.
+        :param transcriber: Transcriber whose transcription is shown, the first one if not given.
+        """
+        self.db_file = db_file
+        self.size = size
+        self.transcriber = transcriber
+        self.transcriber_id = 0
+        self.pages: OrderedDict[str, Tuple[str, bytes]] = OrderedDict()  # Path -> ETag, page.
+        self.lock = Lock()
+        self.version: Optional[Tuple] = None
+        self.folio_names: List[str] = []
+        self.folio_indices: Dict[str, int] = {}
+        self.templates: Dict[str, Template] = {}
+
+    def inputs_version(self) -> Tuple:
+        """
+        Get the sizes and modification times of the inputs of the pages.
+
+        :return: A tuple that changes when an input changes.
+        """
+        version = []
+        for path in [self.db_file, *watched_files]:
+            try:
+                status = stat(path)
+                version.append((status.st_size, status.st_mtime_ns))
+            except FileNotFoundError:
+                version.append(None)
+        return tuple(version)
+
+    def refresh(self) -> None:
+        """
+        Empty the cache and reload the inputs if they changed since the last request.
+        """
+        version = self.inputs_version()
+        if version == self.version:
+            return
+        with open('equivalents.json') as fp:
+            multis = load(fp)
+        vsig.multis.clear()
+        vsig.multis.update(multis)
+        self.templates = {
+            "folio": vsig.load_folio_template('templates/folio.html',
+                                              ["folioName", "contents", "image", "before", "after"]),
+            "missing_folio": vsig.load_folio_template('templates/missing_folio.html',
+                                                      ["folioName", "before", "after"]),
+            "word": vsig.load_template("templates/word.html", ["wordName", "wordAppearanceCount", "appearances"],
+                                       ["variants", "concordance"]),
+            "index": vsig.load_template("templates/general_index.html",
+                                        ["page-title", "list_section", "explanation"])
+        }
+        with vsig.connect_read_only(self.db_file) as db:
+            self.transcriber_id = get_transcriber_id(db.cursor(), self.transcriber)
+            self.folio_names = [row[0] for row in db.execute("SELECT folioName FROM Folio ORDER BY folioID")]
+        self.folio_indices = {folio_name: i for i, folio_name in enumerate(self.folio_names)}
+        self.pages.clear()
+        self.version = version
+
+    def render_folio(self, folio_name: str) -> Optional[str]:
+        """
+        Render the page of a folio.
+
+        :param folio_name: Name or page number of the folio.
+        :return: The page, None if there is no such folio.
+        """
+        i = self.folio_indices.get(folio_name)
+        if i is None:
+            return None
+        with vsig.connect_read_only(self.db_file) as db:
+            folio_paragraphs, similar_folios = vsig.read_folio(db.cursor(), folio_name, self.transcriber_id)
+        folio_before = None if i == 0 else self.folio_names[i - 1]
+        folio_after = None if i == len(self.folio_names) - 1 else self.folio_names[i + 1]
+        template = self.templates["missing_folio" if folio_name in vsig.missing_folios else "folio"]
+        return template.render(vsig.folio_page_values(folio_name, vsig.generate_folio_div(folio_paragraphs),
+                                                      folio_before, folio_after,
+                                                      vsig.generate_related(similar_folios)))
+
+    def render_word(self, word: str) -> Optional[str]:
+        """
+        Render the page of a word.
+
+        :param word: The word.
+        :return: The page, None if there is no such word.
+        """
+        with vsig.connect_read_only(self.db_file) as db:
+            folios = [row[0] for row in db.execute(
+                "SELECT folioName FROM Appears JOIN Folio USING (folioID) WHERE transcriberID = ? AND "
+                "wordID = (SELECT wordID FROM Word WHERE wordName = ?) ORDER BY folioID", (self.transcriber_id, word))]
+            if not folios:
+                return None
+            variants = [row[0] for row in db.execute(
+                "SELECT wordName FROM Variant JOIN Word ON Word.wordID = variantID "
+                "WHERE Variant.wordID = (SELECT wordID FROM Word WHERE wordName = ?) AND "
+                "EXISTS (SELECT 1 FROM Appears WHERE transcriberID = ? AND Appears.wordID = variantID) "
+                "ORDER BY distance, wordName", (word, self.transcriber_id))]
+            concordance = vsig.build_concordance(db.execute(  # Only the folios the word appears in are read.
+                "SELECT folioName, paragraph FROM Paragraph JOIN Folio USING (folioID) WHERE transcriberID = ? AND "
+                "folioID IN (SELECT folioID FROM Appears WHERE transcriberID = ? AND "
+                "wordID = (SELECT wordID FROM Word WHERE wordName = ?)) ORDER BY folioID, paragraphID",
+                (self.transcriber_id, self.transcriber_id, word)), {word})
+        return self.templates["word"].render(vsig.word_page_values(word, folios, variants, concordance.get(word, [])))
+
+    def render_index(self, path: str) -> Optional[str]:
+        """
+        Render an index page, the word index lists the words of the database.
+
+        :param path: Path of the index page, such as word/index.html or folio/index.html.
+        :return: The page, None if there is no such index page.
+        """
+        with vsig.connect_read_only(self.db_file) as db:
+            folio_names, words = vsig.read_index(db.cursor(), self.transcriber_id)
+        values = vsig.index_page_values(folio_names, words).get(path)
+        return None if values is None else self.templates["index"].render(values)
+
+    def render(self, path: str) -> Optional[str]:
+        """
+        Render a page.
+
+        :param path: Path of the page, relative to the root of the site.
+        :return: The page, None if the path is not of a rendered page.
+        """
+        directory, _, name = path.partition('/')
+        if '/' in name or not name.endswith('.html'):
+            return None
+        if name.startswith('index') and directory in ('folio', 'word'):
+            return self.render_index(path)
+        if directory == 'folio':
+            return self.render_folio(name[:-len('.html')])
+        if directory == 'word':
+            return self.render_word(name[:-len('.html')])
+        return None
+
+    def get(self, path: str) -> Optional[Tuple[str, bytes]]:
+        """
+        Get a page from the cache, rendering it if it is not there.
+
+        :param path: Path of the page, relative to the root of the site.
+        :return: ETag and contents of the page, None if the path is not of a rendered page.
+        """
+        with self.lock:
+            self.refresh()
+            if path in self.pages:
+                self.pages.move_to_end(path)
+                return self.pages[path]
+            version = self.version
+        page = self.render(path)  # Rendered outside the lock, so that requests are served in parallel.
+        if page is None:
+            return None
+        contents = page.encode()
+        entry = ('"' + sha1(contents).hexdigest() + '"', contents)
+        with self.lock:
+            if self.version == version:  # Pages of inputs that changed meanwhile are not kept.
+                self.pages[path] = entry
+                self.pages.move_to_end(path)
+                while len(self.pages) > self.size:
+                    self.pages.popitem(last=False)
+        return entry
+
+
+class PreviewHandler(SimpleHTTPRequestHandler):
+    """
+    Serves the rendered pages from the cache and the other files from the disk.
+    """
+    def __init__(self, *args, cache: PageCache, **kwargs):
+        self.cache = cache
+        super().__init__(*args, **kwargs)
+
+    def send_rendered(self, head_only: bool) -> bool:
+        """
+        Send a rendered page, if the request is for one.
+
+        :param head_only: Send only the headers.
+        :return: True if the page was sent.
+        """
+        entry = self.cache.get(unquote(urlsplit(self.path).path).lstrip('/'))
+        if entry is None:
+            return False
+        etag, contents = entry
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return True
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(contents)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        if not head_only:
+            self.wfile.write(contents)
+        return True
+
+    def do_GET(self):
+        if not self.send_rendered(False):
+            super().do_GET()
+
+    def do_HEAD(self):
+        if not self.send_rendered(True):
+            super().do_HEAD()
+
+    def end_headers(self):
+        if self.path.startswith('/media/'):
+            self.send_header('Cache-Control', f'public, max-age={media_max_age}')
+        else:
+            self.send_header('Cache-Control', 'no-cache')  # Revalidated on each request, so edits show at once.
+        super().end_headers()
+
+
+if __name__ == '__main__':
+    program = ArgumentParser(description="Preview the site, rendering the folio and word pages from the database.")
+    program.add_argument("input", help="Voynich data in a SQLite3 file")
+    program.add_argument("--port", "-p", type=int, default=8000, help="Port to listen on.")
+    program.add_argument("--bind", "-b", default="127.0.0.1", help="Address to listen on.")
+    program.add_argument("--cache_size", "-c", type=int, default=1024, help="Number of rendered pages to keep.")
+    program.add_argument("--transcriber", "-t",
+                         help="Transcriber whose transcription is shown, the first one loaded if not given.")
+    args = program.parse_args()
+    handler = partial(PreviewHandler, cache=PageCache(args.input, args.cache_size, args.transcriber), directory='.')
+    with ThreadingHTTPServer((args.bind, args.port), handler) as server:
+        print(f"Serving the site at http://{args.bind}:{args.port}/folio/index.html")
+        server.serve_forever()
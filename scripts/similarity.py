@@ -0,0 +1,146 @@
+"""
+Connections between passages, the folios and the paragraphs
+    are compared by the TF-IDF weighted words they contain,
+    and the most similar ones are saved to the database for
+    the VSIG.py to show as related folios. parser.py computes
+    them again for each transcriber it loads.
+"""
+import sqlite3 as sql
+from argparse import ArgumentParser
+from typing import Dict, Hashable, Iterator, List, Optional, Tuple
+import numpy as np
+from scipy.sparse import csr_matrix, diags
+from metrics import connect
+from parser import get_transcriber_id
+
+
+def term_matrix(documents: List[Tuple[Hashable, Hashable, int]]) -> Tuple[List[Hashable], csr_matrix]:
+    """
+    Build a sparse document by word matrix of word counts.
+
+    :param documents: Document, word, count triplets, a document
+        and word pair may appear more than once.
+    :return: Names of the documents in the order of the rows, and the matrix.
+    """
+    document_ids: Dict[str, int] = {}
+    word_ids: Dict[str, int] = {}
+    rows = np.fromiter((document_ids.setdefault(document, len(document_ids)) for document, _, _ in documents),
+                       dtype=np.int64, count=len(documents))
+    columns = np.fromiter((word_ids.setdefault(word, len(word_ids)) for _, word, _ in documents),
+                          dtype=np.int64, count=len(documents))
+    counts = np.fromiter((count for _, _, count in documents), dtype=np.float64, count=len(documents))
+    matrix = csr_matrix((counts, (rows, columns)), shape=(len(document_ids), len(word_ids)))
+    matrix.sum_duplicates()
+    return list(document_ids), matrix
+
+
+def tf_idf(matrix: csr_matrix) -> csr_matrix:
+    """
+    Weight a term matrix by the inverse document frequencies
+        of the words, and normalise its rows to unit length so
+        that their dot products are their cosine similarities.
+
+    :param matrix: Document by word matrix of word counts.
+    :return: The weighted matrix.
+    """
+    document_count = matrix.shape[0]
+    document_frequency = np.bincount(matrix.indices, minlength=matrix.shape[1])
+    idf = np.log((1 + document_count) / (1 + document_frequency)) + 1
+    weighted = csr_matrix(matrix @ diags(idf))
+    norms = np.sqrt(np.asarray(weighted.multiply(weighted).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return csr_matrix(diags(1 / norms) @ weighted)
+
+
+def top_similar(matrix: csr_matrix, k: int, batch_size: int = 512) -> Iterator[Tuple[int, int, int, float]]:
+    """
+    Find the most similar documents of each document, the similarities
+        of a batch of rows to every row are computed at once.
+
+    :param matrix: Document by word matrix with unit length rows.
+    :param k: Number of similar documents to find for each document.
+    :param batch_size: Number of rows to compare at once.
+    :return: A generator of document, rank, similar document, score quartets.
+    """
+    document_count = matrix.shape[0]
+    k = min(k, document_count - 1)
+    if k <= 0:
+        return
+    transposed = csr_matrix(matrix.T)
+    for start in range(0, document_count, batch_size):
+        end = min(start + batch_size, document_count)
+        scores = (matrix[start:end] @ transposed).toarray()
+        scores[np.arange(end - start), np.arange(start, end)] = -np.inf  # A document is not similar to itself.
+        best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(scores, best, axis=1)
+        order = np.argsort(-best_scores, axis=1, kind='stable')
+        best = np.take_along_axis(best, order, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        for row in range(end - start):
+            for rank in range(k):
+                if best_scores[row, rank] > 0:
+                    yield start + row, rank + 1, int(best[row, rank]), float(best_scores[row, rank])
+
+
+def folio_documents(cursor: sql.Cursor, transcriber_id: int) -> List[Tuple[int, int, int]]:
+    """
+    Get the words of each folio with their counts.
+
+    :param cursor: Cursor to the database.
+    :param transcriber_id: ID of the transcriber whose words are compared.
+    :return: Folio ID, word ID, count triplets.
+    """
+    return cursor.execute("SELECT folioID, wordID, occurrenceCount FROM Appears JOIN Word USING (wordID) "
+                          "WHERE transcriberID = ? AND wordName != ''", (transcriber_id,)).fetchall()
+
+
+def paragraph_documents(cursor: sql.Cursor, transcriber_id: int) -> List[Tuple[int, str, int]]:
+    """
+    Get the words of each paragraph, each word once per appearance.
+
+    :param cursor: Cursor to the database.
+    :param transcriber_id: ID of the transcriber whose lines are compared.
+    :return: Paragraph ID, word, 1 triplets.
+    """
+    cursor.execute("SELECT paragraphID, paragraph FROM Paragraph WHERE transcriberID = ? ORDER BY paragraphID",
+                   (transcriber_id,))
+    return [(paragraph_id, word, 1) for paragraph_id, paragraph in cursor
+            for word in paragraph.split('.') if word]
+
+
+def insert_similarities(db_file: str, k: int = 5, transcriber: Optional[str] = None) -> None:
+    """
+    Compute the most similar folios and paragraphs of a transcriber
+        and replace its old ones in the database with them.
+
+    :param db_file: Database file, of type SQLite3
+    :param k: Number of similar folios and paragraphs to keep for each.
+    :param transcriber: Name of the transcriber, the first one loaded if not given.
+    """
+    with connect(db_file) as db:
+        cursor = db.cursor()
+        transcriber_id = get_transcriber_id(cursor, transcriber)
+        folios, matrix = term_matrix(folio_documents(cursor, transcriber_id))
+        similar_folios = [(transcriber_id, folios[folio], rank, folios[similar], score)
+                          for folio, rank, similar, score in top_similar(tf_idf(matrix), k)]
+        paragraphs, matrix = term_matrix(paragraph_documents(cursor, transcriber_id))
+        similar_paragraphs = [(paragraphs[paragraph], rank, paragraphs[similar], score)
+                              for paragraph, rank, similar, score in top_similar(tf_idf(matrix), k)]
+        cursor.execute("DELETE FROM Similar WHERE transcriberID = ?", (transcriber_id,))
+        cursor.executemany("INSERT INTO Similar(transcriberID, folioID, rank, similarID, score) VALUES(?, ?, ?, ?, ?)",
+                           similar_folios)
+        cursor.execute("DELETE FROM SimilarParagraph WHERE paragraphID IN "
+                       "(SELECT paragraphID FROM Paragraph WHERE transcriberID = ?)", (transcriber_id,))
+        cursor.executemany("INSERT INTO SimilarParagraph(paragraphID, rank, similarID, score) VALUES(?, ?, ?, ?)",
+                           similar_paragraphs)
+        db.commit()
+
+
+if __name__ == '__main__':
+    program = ArgumentParser(description="Find the similar folios and paragraphs of the Voynich Manuscript.")
+    program.add_argument("input", help="Voynich data in a SQLite3 file")
+    program.add_argument("--top", "-k", type=int, default=5, help="Number of similar passages to keep for each.")
+    program.add_argument("--transcriber", "-t",
+                         help="Transcriber whose passages are compared, the first one if not given.")
+    args = program.parse_args()
+    insert_similarities(args.input, args.top, args.transcriber)
@@ -0,0 +1,76 @@
+"""
+Templates have placeholders of the form {%name%}, rather than
+    replacing each placeholder in the whole page one after another,
+    a template is split once into its literal text and its
+    placeholders, and a page is rendered by joining them.
+"""
+from re import compile, Pattern
+from typing import Dict, Iterable, Iterator, List, TextIO
+
+placeholder_pattern: Pattern = compile(r'{%([\w-]+)%}')
+
+
+class TemplateError(Exception):
+    pass
+
+
+class Template:
+    """
+    A template compiled into literal and placeholder segments,
+        literals[i] comes before slots[i], and the last literal
+        comes after the last slot.
+    """
+    def __init__(self, source: str, placeholders: Iterable[str], optional: Iterable[str] = ()):
+        """
+        Compile a template, and check that its placeholders are
+            the ones that will be filled.
+
+        :param source: Source of the template.
+        :param placeholders: Placeholders the template must contain.
+        :param optional: Placeholders the template may contain.
+        """
+        self.source = source
+        parts = placeholder_pattern.split(source)
+        self.literals: List[str] = parts[0::2]
+        self.slots: List[str] = parts[1::2]
+        self.placeholders = set(placeholders)
+        unknown = set(self.slots) - self.placeholders - set(optional)
+        if unknown:
+            raise TemplateError(f'Unknown placeholders in the template: {", ".join(sorted(unknown))}.')
+        missing = self.placeholders - set(self.slots)
+        if missing:
+            raise TemplateError(f'Placeholders missing from the template: {", ".join(sorted(missing))}.')
+
+    def segments(self, values: Dict[str, str]) -> Iterator[str]:
+        """
+        Get the segments of the page in order.
+
+        :param values: Placeholder -> actual value pairs, optional
+            placeholders without a value are left empty.
+        :return: A generator of the segments.
+        """
+        missing = self.placeholders - values.keys()
+        if missing:
+            raise TemplateError(f'No values given for the placeholders: {", ".join(sorted(missing))}.')
+        yield self.literals[0]
+        for slot, literal in zip(self.slots, self.literals[1:]):
+            yield values.get(slot, '')
+            yield literal
+
+    def render(self, values: Dict[str, str]) -> str:
+        """
+        Render the template to a page.
+
+        :param values: Placeholder -> actual value pairs.
+        :return: The generated page.
+        """
+        return ''.join(self.segments(values))
+
+    def write(self, file: TextIO, values: Dict[str, str]) -> None:
+        """
+        Render the template directly into a file.
+
+        :param file: File to write the page to.
+        :param values: Placeholder -> actual value pairs.
+        """
+        file.writelines(self.segments(values))
@@ -0,0 +1,185 @@
+"""
+The whole token stream of the database as arrays, saved as .npy files
+    in a directory so that an analysis can memory-map them in
+    milliseconds rather than query the database row by row. The tokens
+    are indices into the vocabulary, in the order of the lines, and the
+    lines, the folios and the transcribers are ranges of offsets into
+    the arrays below them:
+
+        transcriber_offsets -> paragraphs, folio_offsets -> paragraphs,
+        paragraph_offsets -> tokens.
+
+    Frequencies, n-grams and positions of the words then become
+    array operations, such as the ones below.
+"""
+import sqlite3 as sql
+from argparse import ArgumentParser
+from os import makedirs
+from os.path import join
+from typing import NamedTuple, Optional, Tuple
+import numpy as np
+
+
+class TokenBundle(NamedTuple):
+    """
+    Arrays of a token stream, the names of the fields are the names of their files.
+    """
+    tokens: np.ndarray  # Vocabulary index of each token.
+    words: np.ndarray  # The vocabulary.
+    word_ids: np.ndarray  # Database ID of each word of the vocabulary.
+    paragraph_offsets: np.ndarray  # First token of each line, and the number of tokens at the end.
+    paragraph_ids: np.ndarray  # Database ID of each line.
+    folio_offsets: np.ndarray  # First line of each run of lines of a folio, and the number of lines at the end.
+    folios: np.ndarray  # Name of the folio of each run.
+    transcriber_offsets: np.ndarray  # First line of each transcriber, and the number of lines at the end.
+    transcribers: np.ndarray  # Name of each transcriber.
+
+
+def offsets(lengths: np.ndarray) -> np.ndarray:
+    """
+    Get the offsets of consecutive ranges.
+
+    :param lengths: Lengths of the ranges.
+    :return: Start of each range, followed by the end of the last one.
+    """
+    return np.concatenate(([0], np.cumsum(lengths, dtype=np.int64)))
+
+
+def run_starts(*keys: np.ndarray) -> np.ndarray:
+    """
+    Get where the runs of equal keys start.
+
+    :param keys: Arrays of the same length, a run ends where any of them changes.
+    :return: Index of the first element of each run, and the length of the arrays at the end.
+    """
+    changes = np.zeros(len(keys[0]), dtype=bool)
+    changes[:1] = True
+    for key in keys:
+        changes[1:] |= key[1:] != key[:-1]
+    return np.append(np.flatnonzero(changes), len(keys[0])).astype(np.int64)
+
+
+def build_bundle(cursor: sql.Cursor) -> TokenBundle:
+    """
+    Build the token stream of every transcriber of the database, the
+        lines are split into words the way parser.py splits them.
+
+    :param cursor: Cursor to the database.
+    :return: The arrays of the token stream.
+    """
+    vocabulary = cursor.execute("SELECT wordID, wordName FROM Word ORDER BY wordID").fetchall()
+    indices = {word: i for i, (_, word) in enumerate(vocabulary)}
+    lines = cursor.execute("SELECT paragraphID, transcriberID, folioID, paragraph FROM Paragraph "
+                           "ORDER BY transcriberID, paragraphID").fetchall()
+    split_lines = [line[3].split('.') for line in lines]
+    tokens = np.fromiter((indices[word] for words in split_lines for word in words), dtype=np.int32)
+    paragraph_offsets = offsets(np.fromiter(map(len, split_lines), dtype=np.int64, count=len(lines)))
+    transcriber_ids = np.fromiter((line[1] for line in lines), dtype=np.int64, count=len(lines))
+    folio_ids = np.fromiter((line[2] for line in lines), dtype=np.int64, count=len(lines))
+    folio_offsets = run_starts(transcriber_ids, folio_ids)
+    transcriber_offsets = run_starts(transcriber_ids)
+    folio_names = dict(cursor.execute("SELECT folioID, folioName FROM Folio"))
+    transcriber_names = dict(cursor.execute("SELECT transcriberID, transcriberName FROM Transcriber"))
+    return TokenBundle(
+        tokens=tokens,
+        words=np.array([word for _, word in vocabulary], dtype=str),
+        word_ids=np.array([word_id for word_id, _ in vocabulary], dtype=np.int64),
+        paragraph_offsets=paragraph_offsets,
+        paragraph_ids=np.fromiter((line[0] for line in lines), dtype=np.int64, count=len(lines)),
+        folio_offsets=folio_offsets,
+        folios=np.array([folio_names[folio_id] for folio_id in folio_ids[folio_offsets[:-1]]], dtype=str),
+        transcriber_offsets=transcriber_offsets,
+        transcribers=np.array([transcriber_names[transcriber_id]
+                               for transcriber_id in transcriber_ids[transcriber_offsets[:-1]]], dtype=str))
+
+
+def export_tokens(db_file: str, directory: str) -> None:
+    """
+    Save the token stream of a database to a directory, one .npy file per array.
+
+    :param db_file: Database file, of type SQLite3
+    :param directory: Directory of the arrays, created if it does not exist.
+    """
+    with sql.connect(db_file) as db:
+        bundle = build_bundle(db.cursor())
+    makedirs(directory, exist_ok=True)
+    for name, array in bundle._asdict().items():
+        np.save(join(directory, name + '.npy'), array, allow_pickle=False)
+
+
+def load_tokens(directory: str) -> TokenBundle:
+    """
+    Memory-map the arrays of a token stream, nothing is read until it is used.
+
+    :param directory: Directory the arrays were exported to.
+    :return: The arrays, read only.
+    """
+    return TokenBundle(*(np.load(join(directory, name + '.npy'), mmap_mode='r', allow_pickle=False)
+                         for name in TokenBundle._fields))
+
+
+def transcriber_range(bundle: TokenBundle, transcriber: Optional[str] = None) -> Tuple[int, int]:
+    """
+    Get the tokens of a transcriber.
+
+    :param bundle: The token stream.
+    :param transcriber: Name of the transcriber, the first one if not given.
+    :return: Start and end of the tokens of the transcriber, an empty range if it has no lines.
+    """
+    names = bundle.transcribers.tolist()
+    if transcriber is None and names:
+        transcriber = names[0]
+    if transcriber not in names:
+        return 0, 0
+    i = names.index(transcriber)
+    first_line, end_line = bundle.transcriber_offsets[i], bundle.transcriber_offsets[i + 1]
+    return int(bundle.paragraph_offsets[first_line]), int(bundle.paragraph_offsets[end_line])
+
+
+def token_positions(bundle: TokenBundle) -> np.ndarray:
+    """
+    Get the position of each token in its line, as in the tokenOffset of the appearances.
+
+    :param bundle: The token stream.
+    :return: Position of each token.
+    """
+    starts = bundle.paragraph_offsets[:-1]
+    return np.arange(len(bundle.tokens), dtype=np.int64) - np.repeat(starts, np.diff(bundle.paragraph_offsets))
+
+
+def word_frequencies(bundle: TokenBundle, transcriber: Optional[str] = None) -> np.ndarray:
+    """
+    Count the tokens of each word of a transcriber.
+
+    :param bundle: The token stream.
+    :param transcriber: Name of the transcriber, the first one if not given.
+    :return: Number of tokens of each word of the vocabulary.
+    """
+    start, end = transcriber_range(bundle, transcriber)
+    return np.bincount(bundle.tokens[start:end], minlength=len(bundle.words))
+
+
+def ngram_counts(bundle: TokenBundle, n: int, transcriber: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Count the sequences of n consecutive words of a transcriber, a
+        sequence does not continue from one line to the next.
+
+    :param bundle: The token stream.
+    :param n: Number of words in a sequence.
+    :param transcriber: Name of the transcriber, the first one if not given.
+    :return: The distinct sequences as rows of vocabulary indices, and their counts.
+    """
+    start, end = transcriber_range(bundle, transcriber)
+    if end - start < n:
+        return np.empty((0, n), dtype=bundle.tokens.dtype), np.empty(0, dtype=np.int64)
+    windows = np.lib.stride_tricks.sliding_window_view(bundle.tokens[start:end], n)
+    within_line = token_positions(bundle)[start + n - 1:end] >= n - 1  # The last word is n - 1 words into its line.
+    return np.unique(windows[within_line], axis=0, return_counts=True)
+
+
+if __name__ == '__main__':
+    program = ArgumentParser(description="Export the token stream of the Voynich Manuscript as memory-mappable arrays.")
+    program.add_argument("input", help="Voynich data in a SQLite3 file")
+    program.add_argument("output", help="Directory to save the arrays to.")
+    args = program.parse_args()
+    export_tokens(args.input, args.output)
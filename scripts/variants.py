@@ -0,0 +1,117 @@
+"""
+Alternate forms of the words, such as qokeedy, qokedy and okeedy, are
+    words within a small edit distance of each other. Rather than
+    comparing every pair of words, each word is indexed by the strings
+    left after deleting up to that many of its characters, two words
+    within the distance always share such a string, so only the words
+    that share one are compared. The alternate forms are saved to the
+    database for the VSIG.py to show on the word pages, parser.py finds
+    the ones of the words each load adds.
+"""
+from argparse import ArgumentParser
+from itertools import combinations
+from json import dumps
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+from metrics import connect
+
+
+def deletions(word: str, distance: int) -> Set[str]:
+    """
+    Get the strings left after deleting up to distance characters of a word.
+
+    :param word: The word.
+    :param distance: Maximum number of characters to delete.
+    :return: The strings, including the word itself.
+    """
+    keys = {word}
+    for length in range(max(0, len(word) - distance), len(word)):
+        keys.update(''.join(kept) for kept in combinations(word, length))
+    return keys
+
+
+def edit_distance(word: str, other: str, bound: int) -> Optional[int]:
+    """
+    Get the Levenshtein distance of two words, giving up as soon
+        as it is certain to exceed the bound.
+
+    :param word: First word.
+    :param other: Second word.
+    :param bound: Largest distance of interest.
+    :return: The distance, None if it is larger than the bound.
+    """
+    if abs(len(word) - len(other)) > bound:
+        return None
+    previous = list(range(len(other) + 1))
+    for i, char in enumerate(word, 1):
+        current = [i]
+        for j, other_char in enumerate(other, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char != other_char)))
+        if min(current) > bound:
+            return None
+        previous = current
+    return previous[-1] if previous[-1] <= bound else None
+
+
+def find_variants(words: List[str], distance: int = 1,
+                  new: Optional[Set[str]] = None) -> Iterator[Tuple[str, str, int]]:
+    """
+    Find the pairs of words within an edit distance of each other.
+
+    :param words: Distinct words.
+    :param distance: Maximum edit distance of the variants.
+    :param new: If given, only the pairs with at least one of these words are found.
+    :return: A generator of word, variant, distance triplets, each pair once.
+    """
+    index: Dict[str, List[int]] = {}  # Deletion -> indices of the words it is a deletion of.
+    for i, word in enumerate(words):
+        for key in deletions(word, distance):
+            index.setdefault(key, []).append(i)
+    for i, word in enumerate(words):
+        if new is not None and word not in new:
+            continue  # Its pairs with the new words are found from the new words.
+        candidates = {j for key in deletions(word, distance) for j in index[key]
+                      if j > i or (new is not None and words[j] not in new)}
+        for j in sorted(candidates):
+            word_distance = edit_distance(word, words[j], distance)
+            if word_distance is not None:
+                yield word, words[j], word_distance
+
+
+def insert_variants(db_file: str, distance: int = 1, words: Optional[List[str]] = None) -> None:
+    """
+    Find the alternate forms of every word of every transcriber and
+        replace the old ones in the database with them.
+
+    :param db_file: Database file, of type SQLite3
+    :param distance: Maximum edit distance of the alternate forms.
+    :param words: If given, only the alternate forms of these words, such
+        as the ones a load added, are found and added to the old ones.
+    """
+    with connect(db_file) as db:
+        cursor = db.cursor()
+        word_ids = dict(cursor.execute("SELECT wordName, wordID FROM Word WHERE wordName != ''"))
+        new = None if words is None else set(words) & word_ids.keys()
+        if new is not None and not new:
+            return
+        if new is not None and len(new) == len(word_ids):  # Such as after loading a new database.
+            new = None
+        variants = [(word_ids[word], word_ids[variant], word_distance)
+                    for pair in find_variants(list(word_ids), distance, new)
+                    for word, variant, word_distance in (pair, (pair[1], pair[0], pair[2]))]
+        if new is None:
+            cursor.execute("DELETE FROM Variant")
+        else:
+            new_ids = dumps([word_ids[word] for word in new])  # A single scan of the table for all of them.
+            cursor.execute("DELETE FROM Variant WHERE wordID IN (SELECT value FROM json_each(?)) "
+                           "OR variantID IN (SELECT value FROM json_each(?))", (new_ids, new_ids))
+        cursor.executemany("INSERT INTO Variant(wordID, variantID, distance) VALUES(?, ?, ?)", variants)
+        db.commit()
+
+
+if __name__ == '__main__':
+    program = ArgumentParser(description="Find the alternate forms of the words of the Voynich Manuscript.")
+    program.add_argument("input", help="Voynich data in a SQLite3 file")
+    program.add_argument("--distance", "-d", type=int, default=1,
+                         help="Maximum number of edits between a word and its alternate forms.")
+    args = program.parse_args()
+    insert_variants(args.input, args.distance)
@@ -1,12 +1,25 @@
 from argparse import ArgumentParser
-from typing import List, Optional, Dict
-from os import listdir
+from typing import List, Optional, Dict, Callable, Iterable, Iterator, Set, Tuple
+from os import remove
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby
+from operator import itemgetter
 import sqlite3 as sql
-from os.path import exists
+from os.path import exists, join, splitext
+from urllib.parse import quote
+from html import escape
 from template_commons import footer, header, explanation_word, explanation_folio
 from pathlib import Path
-from json import load
+from math import log10
+from json import load, loads, dumps
 from warnings import warn
+from manifest import load_manifest, save_manifest, hash_inputs, hash_file
+from metrics import (connect, count, count_written, stage, is_recording, start_recording, call_recorded,
+                     merge_recorded, save_metrics, print_metrics, dump_profile)
+from template_engine import Template
+from parser import get_transcriber_id
+from pack import pack_site
+from check_site import check_site, print_report
 
 
 class MissingImageWarning(Warning):
@@ -27,6 +40,7 @@ def generate_missing_folios():
 
 missing_folios = generate_missing_folios()
 print(missing_folios)
+generator_hash = hash_file(__file__)  # Changes to the generator invalidate every page.
 
 
 missing_card = r"""
@@ -39,6 +53,26 @@ missing_card = r"""
             </div>
 """
 
+search_box = r"""
+                    <div class="search">
+                        <select id="search_mode">
+                            <option value="prefix">Starts with</option>
+                            <option value="substring">Contains</option>
+                        </select>
+                        <input type="search" id="search_query" placeholder="Search words">
+                        <ul id="search_results"></ul>
+                    </div>
+                    <script src="../scripts/search.js"></script>
+                    <script>attachSearch("search_query", "search_mode", "search_results");</script>
+"""
+
+responsive_folio_image = r"""
+            <div class="folio_image">
+                <img class="voynich_folio_page" src="{src}" srcset="{srcset}"
+                     sizes="(min-width: 768px) 66vw, 100vw" alt="Image description"{zoom}/>
+            </div>
+"""
+
 folio_image = r"""
             <div class="folio_image">
                 <img class="voynich_folio_page" src="../media/portrait.jpg" alt="Image description"/>
@@ -46,76 +80,387 @@ folio_image = r"""
 """
 
 
-def replace_templates(replace_dict: Dict[str, str], template: str) -> str:
+def connect_read_only(db_file: str) -> sql.Connection:
+    """
+    Open the SQLite3 database in read-only mode, so that
+        many processes can share it safely.
+
+    :param db_file: Database file, of type SQLite3
+    :return: A connection to the database.
+    """
+    return connect(f'file:{db_file}?mode=ro', uri=True)
+
+
+def run_in_chunks(function: Callable[..., Dict[str, str]], db_file: str, names: List[str], jobs: int,
+                  manifest: Dict[str, str], *args, by_name: Optional[Dict[str, object]] = None) -> Dict[str, str]:
+    """
+    Run a page generator over the names, either in this process
+        or split into chunks across a pool of worker processes.
+
+    :param function: Generator that takes the database file, the names,
+        the start and end indices of the chunk it should generate, the
+        manifest of the previous build and the other arguments, and
+        returns the input hashes of the pages it generated.
+    :param db_file: Database file, of type SQLite3
+    :param names: Names of the pages to generate.
+    :param jobs: Number of worker processes, 1 to generate serially.
+    :param manifest: Page path -> input hash pairs of the previous build.
+    :param args: Other arguments of the generator.
+    :param by_name: Name -> value pairs passed to the generator after the
+        other arguments, each chunk is sent only the values of its names.
+    :return: Page path -> input hash pairs of this build.
+    """
+    if jobs <= 1:
+        return function(db_file, names, 0, len(names), manifest, *args, *([] if by_name is None else [by_name]))
+    chunk_size = max(1, -(-len(names) // (jobs * 4)))  # A few chunks per worker balance the load.
+    hashes = {}
+    with ProcessPoolExecutor(jobs) as executor:
+        futures = []
+        for start in range(0, len(names), chunk_size):
+            end = min(start + chunk_size, len(names))
+            chunk_args = args if by_name is None else \
+                (*args, {name: by_name[name] for name in names[start:end] if name in by_name})
+            futures.append(executor.submit(call_recorded, is_recording(), function, db_file, names, start, end,
+                                           manifest, *chunk_args))
+        for future in futures:
+            chunk_hashes, recorded = future.result()  # Also re-raises the errors of the workers.
+            hashes.update(chunk_hashes)
+            merge_recorded(recorded)
+    return hashes
+
+
+def is_up_to_date(path: str, input_hash: str, manifest: Dict[str, str]) -> bool:
+    """
+    Check if a page was generated from the same inputs before.
+
+    :param path: Path of the page.
+    :param input_hash: Hash of the inputs of the page.
+    :param manifest: Page path -> input hash pairs of the previous build.
+    :return: True if the page does not need to be generated again.
+    """
+    return manifest.get(path) == input_hash and exists(path)
+
+
+def remove_orphans(old_manifest: Dict[str, str], new_manifest: Dict[str, str]) -> None:
+    """
+    Remove the pages of the previous build that are not generated anymore,
+        such as the pages of words removed from the transcription.
+
+    :param old_manifest: Page path -> input hash pairs of the previous build.
+    :param new_manifest: Page path -> input hash pairs of this build.
+    """
+    for path in old_manifest.keys() - new_manifest.keys():
+        if exists(path):
+            remove(path)
+
+
+first_link = '<a href="f1r.html"><<</a>'
+last_link = '<a href="f116v.html">>></a>'
+
+
+def load_template(path: str, placeholders: Iterable[str], optional: Iterable[str] = ()) -> Template:
+    """
+    Load a template, fill the parts common to every page and compile it.
+
+    :param path: Path of the template file.
+    :param placeholders: Placeholders the template must contain.
+    :param optional: Placeholders the template may contain.
+    :return: The compiled template.
+    """
+    with open(path) as template_file:
+        source = template_file.read()
+    return Template(set_template_commons(source), placeholders, optional)
+
+
+def load_folio_template(path: str, placeholders: List[str]) -> Template:
+    """
+    Load a folio template, the image and the links to the first
+        and the last folio are turned into placeholders as well.
+
+    :param path: Path of the template file.
+    :param placeholders: Placeholders the template must contain, the
+        image is turned into a placeholder only if "image" is one of them.
+    :return: The compiled template.
+    """
+    with open(path) as template_file:
+        source = set_template_commons(template_file.read())
+    if "image" in placeholders:  # Otherwise a template whose image differs would show the stand-in image.
+        source = source.replace(folio_image, "{%image%}")
+    source = source.replace(first_link, "{%first%}").replace(last_link, "{%last%}")
+    return Template(source, placeholders, ["contents", "first", "last", "related"])
+
+
+def word_link(word: str, directory: str = '') -> str:
+    """
+    Generate a link to the page of a word, EVA words may hold
+        characters such as " that HTML and URLs do not take as they are.
+
+    :param word: The word.
+    :param directory: Path of the word pages, relative to the page of the link.
+    :return: The <a> tag.
+    """
+    return f'<a href="{directory}{quote(word, safe="")}.html">{escape(word)}</a>'
+
+
+def generate_variants(variants: List[str]) -> str:
+    """
+    Generate the similar forms section of a word page.
+
+    :param variants: Alternate forms of the word, closest first.
+    :return: The string to put into the HTML, empty if there are no alternate forms.
+    """
+    if not variants:
+        return ""
+    links = ' '.join(word_link(variant) for variant in variants)
+    return f'<div class="section variants"><h4>Similar Forms</h4><p>{links}</p></div>'
+
+
+Occurrence = Tuple[str, int, str, str]  # Folio, line number, words before and words after an occurrence.
+concordance_context = 3  # Words shown on each side of an occurrence in the concordance.
+
+
+def build_concordance(lines: Iterable[Tuple[str, str]], words: Set[str],
+                      context: int = concordance_context) -> Dict[str, List[Occurrence]]:
+    """
+    Find every occurrence of the words in a single pass over the lines,
+        rather than searching the lines once for each word.
+
+    :param lines: Folio name, line pairs, ordered by folio and then by
+        line, as the lines are numbered on the folio pages.
+    :param words: Words to find.
+    :param context: Number of words to keep on each side of an occurrence.
+    :return: Word -> occurrences of the word pairs, in the order of the lines.
+    """
+    concordance: Dict[str, List[Occurrence]] = {}
+    for folio_name, folio_lines in groupby(lines, key=itemgetter(0)):
+        for line_number, (_, line) in enumerate(folio_lines, 1):
+            tokens = line.split('.')
+            for position, token in enumerate(tokens):
+                if token in words:
+                    concordance.setdefault(token, []).append(
+                        (folio_name, line_number, ' '.join(tokens[max(0, position - context):position]),
+                         ' '.join(tokens[position + 1:position + 1 + context])))
+    return concordance
+
+
+def generate_concordance(word: str, occurrences: List[Occurrence]) -> str:
+    """
+    Generate the concordance section of a word page, each occurrence
+        links to its line on the folio page.
+
+    :param word: Word of the page.
+    :param occurrences: Occurrences of the word, in order.
+    :return: The string to put into the HTML, empty if there are no occurrences.
+    """
+    if not occurrences:
+        return ""
+    rows = ''.join(f'<tr><td><a href="../folio/{folio_name}.html#line-{line_number}">{folio_name}.{line_number}</a>'
+                   f'</td><td class="left">{escape(before)}</td><td><b>{escape(word)}</b></td>'
+                   f'<td>{escape(after)}</td></tr>' for folio_name, line_number, before, after in occurrences)
+    return f'<div class="section concordance"><h4>Concordance</h4><table>{rows}</table></div>'
+
+
+def word_page_values(word: str, folios: List[str], variants: List[str] = (),
+                     occurrences: List[Occurrence] = ()) -> Dict[str, str]:
     """
-    Replace the placeholders on a template to create a page.
+    Get the values of the placeholders of a word page.
 
-    :param replace_dict: Replacement values for placeholder -> actual value.
-    :param template: Template to replace in.
-    :return: The generated page.
+    :param word: Word of the page.
+    :param folios: Folios the word appears in, in order.
+    :param variants: Alternate forms of the word, closest first.
+    :param occurrences: Occurrences of the word, in order.
+    :return: Placeholder -> value pairs.
     """
-    page = template
-    for placeholder in replace_dict:
-        page = page.replace("{%" + placeholder + "%}", replace_dict[placeholder])
-    return page
+    return {
+        "wordName": word,
+        "wordAppearanceCount": str(len(folios)),
+        "appearances": get_list(folios, "../folio/", ".html"),
+        "variants": generate_variants(variants),
+        "concordance": generate_concordance(word, occurrences)
+    }
 
 
-def generate_word_page(word: str, cursor: sql.Cursor, template: str) -> None:
+def generate_word_page(word: str, folios: List[str], template: Template,
+                       manifest: Optional[Dict[str, str]] = None, variants: List[str] = (),
+                       occurrences: List[Occurrence] = ()) -> str:
     """
     Generate a word page for the given word, which shows
-        pages it appears in, its appearance number, as well
-        as its various alternate forms.
+        pages it appears in, its appearance number, its various
+        alternate forms, as well as each of its occurrences in context.
 
     :param word: Word to create the page for.
-    :param cursor: Cursor to the database.
+    :param folios: Folios the word appears in, in order.
     :param template: Template to create the page from.
+    :param manifest: Page path -> input hash pairs of the previous build,
+        if the inputs of the page did not change, it is not written.
+    :param variants: Alternate forms of the word, closest first.
+    :param occurrences: Occurrences of the word, in order.
+    :return: Hash of the inputs of the page.
+    """
+    path = f"word/{word}.html"
+    input_hash = hash_inputs(generator_hash, template.source, word, *folios, variants, occurrences)
+    if manifest is not None and is_up_to_date(path, input_hash, manifest):
+        return input_hash
+    with open(path, "w") as page_file:
+        template.write(page_file, word_page_values(word, folios, variants, occurrences))
+        count_written(page_file)
+    return input_hash
+
+
+def rows_by_word(rows: Iterable[tuple], words: Iterable[str]) -> Iterator[List[tuple]]:
+    """
+    Split rows sorted by their first column, a word, into the rows of each word.
+
+    :param rows: Rows sorted by word.
+    :param words: Sorted words, which may have no rows, the rows of other words are skipped.
+    :return: A generator of the rows of each word, in the order of the words.
+    """
+    groups = groupby(rows, key=itemgetter(0))
+    group = next(groups, None)
+    for word in words:
+        while group is not None and group[0] < word:
+            group = next(groups, None)
+        word_rows = []
+        if group is not None and group[0] == word:
+            word_rows = list(group[1])
+            group = next(groups, None)
+        yield word_rows
+
+
+def generate_word_chunk(db_filename: str, words: List[str], start: int, end: int, manifest: Dict[str, str],
+                        transcriber_id: int, concordance: Dict[str, List[Occurrence]]) -> Dict[str, str]:
     """
-    page = template.replace("{%wordName%}", word)
-    appearances = cursor.execute("SELECT folioName FROM Appears WHERE wordName = ? ORDER BY appearanceID", (word,))
-    folios = [appearance[0] for appearance in appearances]
-    page = page.replace("{%wordAppearanceCount%}", str(len(folios)))
-    folios = get_list(folios, "../folio/", ".html")
-    page = page.replace("{%appearances%}", folios)
-    with open(f"word/{word}.html", "w") as page_file:
-        page_file.write(page)
+    Generate the word pages of the words between the start and end indices,
+        the appearances and the alternate forms of the chunk are each read
+        in a single ordered scan.
 
+    :param db_filename: The path of the SQLite3 file.
+    :param words: Names of the words, sorted.
+    :param start: Index of the first word of the chunk.
+    :param end: Index after the last word of the chunk.
+    :param manifest: Page path -> input hash pairs of the previous build.
+    :param transcriber_id: ID of the transcriber whose appearances are shown.
+    :param concordance: Word -> occurrences of the word pairs, of the words of the chunk at least.
+    :return: Page path -> input hash pairs of the generated pages.
+    """
+    template = load_template("templates/word.html", ["wordName", "wordAppearanceCount", "appearances"],
+                             ["variants", "concordance"])
+    hashes = {}
+    if start >= end:
+        return hashes
+    with connect_read_only(db_filename) as database:
+        appearances = database.execute(  # Cross join walks the words in order, so the rows need no sorting.
+            "SELECT wordName, folioName FROM Word CROSS JOIN Appears USING (wordID) JOIN Folio USING (folioID) "
+            "WHERE transcriberID = ? AND wordName BETWEEN ? AND ? ORDER BY wordName, folioID",
+            (transcriber_id, words[start], words[end - 1]))
+        variants = database.execute(  # Only the alternate forms that have pages of their own.
+            "SELECT word.wordName, form.wordName FROM Word AS word "
+            "JOIN Variant ON Variant.wordID = word.wordID JOIN Word AS form ON form.wordID = variantID "
+            "WHERE word.wordName BETWEEN ? AND ? AND "
+            "EXISTS (SELECT 1 FROM Appears WHERE transcriberID = ? AND Appears.wordID = word.wordID) AND "
+            "EXISTS (SELECT 1 FROM Appears WHERE transcriberID = ? AND Appears.wordID = variantID) "
+            "ORDER BY word.wordName, distance, form.wordName",
+            (words[start], words[end - 1], transcriber_id, transcriber_id))
+        # Both scans and the words are sorted by word, so they are read side by side.
+        for word, word_appearances, word_variants in zip(words[start:end],
+                                                         rows_by_word(appearances, words[start:end]),
+                                                         rows_by_word(variants, words[start:end])):
+            hashes[f"word/{word}.html"] = generate_word_page(word, [row[1] for row in word_appearances], template,
+                                                             manifest, [row[1] for row in word_variants],
+                                                             concordance.get(word, []))
+    return hashes
 
-def generate_word_pages(db_filename: str) -> None:
+
+def generate_word_pages(db_filename: str, jobs: int = 1, manifest: Optional[Dict[str, str]] = None,
+                        transcriber: Optional[str] = None) -> Dict[str, str]:
     """
     Given the name of the SQLite3 file containing
         data on the Voynich word appearances generate word pages.
     
     :param db_filename: The path of the SQLite3 file.
+    :param jobs: Number of worker processes to generate the pages with.
+    :param manifest: Page path -> input hash pairs of the previous build.
+    :param transcriber: Transcriber whose words are shown, the first one if not given.
+    :return: Page path -> input hash pairs of this build.
     """
-    with open("templates/word.html") as template_file:
-        template = template_file.read()
-    template = set_template_commons(template)
-    with sql.connect(db_filename) as database:
+    with connect(db_filename) as database:
         cursor = database.cursor()
-        cursor.execute("SELECT * FROM Word")
-        words = cursor.fetchall()
-        for word in words:
-            word = word[1]
-            generate_word_page(word, cursor, template)
+        transcriber_id = get_transcriber_id(cursor, transcriber)
+        cursor.execute("SELECT wordName FROM Word WHERE wordID IN "
+                       "(SELECT wordID FROM Appears WHERE transcriberID = ?) ORDER BY wordName", (transcriber_id,))
+        words = [word[0] for word in cursor.fetchall()]
+        concordance = build_concordance(cursor.execute(  # Once for every word, rather than once per chunk.
+            "SELECT folioName, paragraph FROM Paragraph JOIN Folio USING (folioID) WHERE transcriberID = ? "
+            "ORDER BY folioID, paragraphID", (transcriber_id,)), set(words))
+    return run_in_chunks(generate_word_chunk, db_filename, words, jobs, manifest or {}, transcriber_id,
+                         by_name=concordance)
 
 
 def generate_folio_div(paragraphs: List[str]) -> str:
     """
-    Generate the paragraph text with the <a> tags.
+    Generate the paragraph text with the <a> tags, each line has
+        an id of its number, such as line-3, for the concordances to link to.
 
     :param paragraphs: A list of paragraphs queried from the SQLite3 file.
     :return: The string to put into the HTML.
     """
-    string_ = ""
+    lines = []
     for i, paragraph in enumerate(paragraphs):
         words = paragraph[0].split('.')
-        words = [f'<a class="voynich-word" href="../word/{word}.html">{word}</a>' for word in words]
-        string_ += f'<sup>{i + 1}</sup>' + ' '.join(words) + '</br>'
-    return string_
+        words = [f'<a class="voynich-word" href="../word/{quote(word, safe="")}.html">{escape(word)}</a>'
+                 for word in words]
+        lines.append(f'<sup id="line-{i + 1}">{i + 1}</sup>' + ' '.join(words) + '</br>')
+    return ''.join(lines)
+
+
+def generate_related(similar_folios: List[Tuple[str, float]]) -> str:
+    """
+    Generate the related folios section of a folio page.
+
+    :param similar_folios: Similar folio name, score pairs, most similar first.
+    :return: The string to put into the HTML, empty if there are no similar folios.
+    """
+    if not similar_folios:
+        return ""
+    links = ' '.join(f'<a href="{similar}.html">{similar}</a> <small>{score:.2f}</small>'
+                     for similar, score in similar_folios)
+    return f'<div class="section related"><h4>Related Folios</h4><p>{links}</p></div>'
 
 
-def generate_folio_page(folio_name: str, folio_paragraphs: str, template: str,
-                        folio_before: Optional[str], folio_after: Optional[str], do_warn = True) -> None:
+def folio_page_values(folio_name: str, folio_paragraphs: str, folio_before: Optional[str],
+                      folio_after: Optional[str], related: str = "") -> Dict[str, str]:
+    """
+    Get the values of the placeholders of a folio page.
+
+    :param folio_name: Name or page number of the folio.
+    :param folio_paragraphs: Paragraphs in the folio.
+    :param folio_before: Folio before this one, None for the first folio.
+    :param folio_after: Folio after this one, None for the last folio.
+    :param related: Related folios section of the page.
+    :return: Placeholder -> value pairs.
+    """
+    image = folio_image
+    image_name = resolve_image(folio_name)
+    if image_name:
+        image = generate_image(image_name)
+    elif folio_name not in missing_folios:
+        warn(f'No image found for {folio_name}.', MissingImageWarning)
+        image = missing_card  # Display an error if the image is missing.
+    return {
+        "folioName": folio_name,
+        "contents": folio_paragraphs,
+        "before": f'<a id="before_link" href="{folio_before}.html"><b><</b></a>' if folio_before else "",
+        "first": first_link if folio_before else "",
+        "after": f'<a id="after_link" href="{folio_after}.html"><b>></b></a>' if folio_after else "",
+        "last": last_link if folio_after else "",
+        "image": image,
+        "related": related
+    }
+
+
+def generate_folio_page(folio_name: str, folio_paragraphs: str, template: Template,
+                        folio_before: Optional[str], folio_after: Optional[str], do_warn = True,
+                        related: str = "") -> None:
     """
     Generate a folio page from a given folio name and the paragraph of the
         Folio.
@@ -123,27 +468,62 @@ def generate_folio_page(folio_name: str, folio_paragraphs: str, template: str,
     :param folio_name: Name or page number of the folio.
     :param folio_paragraphs: Paragraphs in the folio.
     :param template: HTML template file about the folio.
+    :param related: Related folios section of the page.
     """
-    page = template.replace("{%folioName%}", folio_name)
-    page = page.replace("{%contents%}", folio_paragraphs)
-    if folio_before:
-        page = page.replace("{%before%}", f'<a id="before_link" href="{folio_before}.html"><b><</b></a>')
-    else:
-        page = page.replace("{%before%}", "").replace('<a href="f1r.html"><<</a>', "")
-    if folio_after:
-        page = page.replace("{%after%}", f'<a id="after_link" href="{folio_after}.html"><b>></b></a>')
-    else:
-        page = page.replace("{%after%}", "").replace('<a href="f116v.html">>></a>', "")
-    image_name = folio_name + '.jpg'
-    if folio_name in multis:
-        image_name = multis[folio_name]
-    if exists(f'media/{image_name}'):
-        page = page.replace("portrait.jpg", image_name)
-    elif folio_name not in missing_folios:
-        warn(f'No image found for {folio_name}.', MissingImageWarning)
-        page = page.replace(folio_image, missing_card)  # Display an error if the image is missing.
     with open(f'folio/{folio_name}.html', 'w') as web_page:
-        web_page.write(page)
+        template.write(web_page, folio_page_values(folio_name, folio_paragraphs, folio_before, folio_after, related))
+        count_written(web_page)
+
+
+def load_derivatives(image_name: str) -> Optional[dict]:
+    """
+    Load the description of the thumbnail, widths and tiles
+        media_build.py built for an image.
+
+    :param image_name: Name of the image file in media/.
+    :return: The description, None if the image was not built.
+    """
+    path = join('media/derived', splitext(image_name)[0], 'index.json')
+    if not exists(path):
+        return None
+    with open(path) as fp:
+        return load(fp)
+
+
+def generate_image(image_name: str) -> str:
+    """
+    Generate the image of a folio page, using the smaller widths
+        of the image as its srcset if they were built.
+
+    :param image_name: Name of the image file in media/.
+    :return: The HTML of the image.
+    """
+    derivatives = load_derivatives(image_name)
+    if derivatives is None or not derivatives["widths"]:
+        return folio_image.replace("portrait.jpg", image_name)
+    directory = '../media/derived/' + quote(splitext(image_name)[0])  # Commas would break the srcset.
+    sources = [f'{directory}/w{width}.jpg {width}w' for width in derivatives["widths"]]
+    sources.append(f'../media/{quote(image_name)} {derivatives["width"]}w')
+    zoom = ''
+    if derivatives["tiles"]:
+        zoom = f' data-dzi="{directory}/{derivatives["tiles"]}" onclick="openDeepZoom(this);"'
+    return responsive_folio_image.format(src=f'{directory}/w{derivatives["widths"][-1]}.jpg',
+                                         srcset=', '.join(sources), zoom=zoom)
+
+
+def resolve_image(folio_name: str) -> Optional[str]:
+    """
+    Find the image of a folio, which may be its crop from
+        an image of multiple folios, see folio_split.py,
+        or the image of multiple folios itself.
+
+    :param folio_name: Name or page number of the folio.
+    :return: Name of the image file in media/, None if it does not exist.
+    """
+    if exists(f'media/crops/{folio_name}.jpg'):
+        return f'crops/{folio_name}.jpg'
+    image_name = multis.get(folio_name, folio_name + '.jpg')
+    return image_name if exists(f'media/{image_name}') else None
 
 
 def set_template_commons(template) -> str:
@@ -157,27 +537,85 @@ def set_template_commons(template) -> str:
     return template
 
 
-def generate_folio_pages(db_file):
-    with open('templates/folio.html') as template_file:
-        template = template_file.read()
-    template = set_template_commons(template)
-    with open('templates/missing_folio.html') as missing_file:
-        missing_template = missing_file.read()
-    missing_template = set_template_commons(missing_template)
-    with sql.connect(db_file) as db:
+def read_folio(cursor: sql.Cursor, folio_name: str,
+               transcriber_id: int) -> Tuple[List[Tuple[str]], List[Tuple[str, float]]]:
+    """
+    Read what a folio page shows from the database.
+
+    :param cursor: Cursor to the database.
+    :param folio_name: Name or page number of the folio.
+    :param transcriber_id: ID of the transcriber whose lines are shown.
+    :return: Paragraphs of the folio, and similar folio name, score pairs.
+    """
+    cursor.execute("SELECT paragraph FROM Paragraph WHERE transcriberID = ? AND "
+                   "folioID = (SELECT folioID FROM Folio WHERE folioName = ?) ORDER BY paragraphID",
+                   (transcriber_id, folio_name))
+    folio_paragraphs = cursor.fetchall()
+    cursor.execute("SELECT folioName, score FROM Similar JOIN Folio ON Folio.folioID = similarID "
+                   "WHERE transcriberID = ? AND Similar.folioID = (SELECT folioID FROM Folio WHERE folioName = ?) "
+                   "ORDER BY rank", (transcriber_id, folio_name))
+    return folio_paragraphs, cursor.fetchall()
+
+
+def generate_folio_chunk(db_file: str, folio_names: List[str], start: int, end: int,
+                         manifest: Dict[str, str], transcriber_id: int) -> Dict[str, str]:
+    """
+    Generate the folio pages of the folios between the start and end indices.
+
+    :param db_file: Database file, of type SQLite3
+    :param folio_names: Names of all folios in order, the neighbours
+        of a chunk are needed for the navigation links.
+    :param start: Index of the first folio of the chunk.
+    :param end: Index after the last folio of the chunk.
+    :param manifest: Page path -> input hash pairs of the previous build.
+    :param transcriber_id: ID of the transcriber whose lines are shown.
+    :return: Page path -> input hash pairs of the generated pages.
+    """
+    template = load_folio_template('templates/folio.html', ["folioName", "contents", "image", "before", "after"])
+    missing_template = load_folio_template('templates/missing_folio.html', ["folioName", "before", "after"])
+    hashes = {}
+    with connect_read_only(db_file) as db:
         cursor = db.cursor()
-        cursor.execute("SELECT folioName FROM Folio ORDER BY folioID;")
-        folio_names = cursor.fetchall()
-        for i, folio_name in enumerate(folio_names):
-            cursor.execute("SELECT paragraph FROM Paragraph WHERE folioName = ? ORDER BY paragraphID", folio_name)
-            folio_paragraphs = cursor.fetchall()
+        for i in range(start, end):
+            folio_name = folio_names[i]
+            folio_paragraphs, similar_folios = read_folio(cursor, folio_name, transcriber_id)
+            folio_before = None if i == 0 else folio_names[i - 1]
+            folio_after = None if i == len(folio_names) - 1 else folio_names[i + 1]
+            folio_template = missing_template if folio_name in missing_folios else template
+            path = f'folio/{folio_name}.html'
+            image_name = resolve_image(folio_name)
+            hashes[path] = hash_inputs(generator_hash, folio_template.source, folio_name, folio_before, folio_after,
+                                       image_name, image_name and load_derivatives(image_name), similar_folios,
+                                       *folio_paragraphs)
+            if is_up_to_date(path, hashes[path], manifest):
+                continue
             paragraph_text = generate_folio_div(folio_paragraphs)
-            folio_before = None if i == 0 else folio_names[i - 1][0]
-            folio_after = None if i == len(folio_names) - 1 else folio_names[i + 1][0]
-            if folio_name[0] in missing_folios:
-                generate_folio_page(folio_name[0], paragraph_text, missing_template, folio_before, folio_after, False)
+            related = generate_related(similar_folios)
+            if folio_name in missing_folios:
+                generate_folio_page(folio_name, paragraph_text, missing_template, folio_before, folio_after, False,
+                                    related)
             else:
-                generate_folio_page(folio_name[0], paragraph_text, template, folio_before, folio_after)
+                generate_folio_page(folio_name, paragraph_text, template, folio_before, folio_after, related=related)
+    return hashes
+
+
+def generate_folio_pages(db_file: str, jobs: int = 1, manifest: Optional[Dict[str, str]] = None,
+                         transcriber: Optional[str] = None) -> Dict[str, str]:
+    """
+    Generate the pages of each folio in the database.
+
+    :param db_file: Database file, of type SQLite3
+    :param jobs: Number of worker processes to generate the pages with.
+    :param manifest: Page path -> input hash pairs of the previous build.
+    :param transcriber: Transcriber whose lines are shown, the first one if not given.
+    :return: Page path -> input hash pairs of this build.
+    """
+    with connect(db_file) as db:
+        cursor = db.cursor()
+        transcriber_id = get_transcriber_id(cursor, transcriber)
+        cursor.execute("SELECT folioName FROM Folio ORDER BY folioID;")
+        folio_names = [folio_name[0] for folio_name in cursor.fetchall()]
+    return run_in_chunks(generate_folio_chunk, db_file, folio_names, jobs, manifest or {}, transcriber_id)
 
 
 def get_list(list_: List[str], path: str = '', extension: str = '') -> str:
@@ -192,47 +630,370 @@ def get_list(list_: List[str], path: str = '', extension: str = '') -> str:
         the end of the file.
     :return: the HTML version of the list.
     """
-    html_list = "<ul>"
-    html_list += "\n".join(['<li> <a href="' + path + element + extension + '">'
-                            + element.replace(".html", "") + '</a></li>' for element in list_])
-    html_list += "</ul>"
-    return html_list
+    return "<ul>" + "\n".join(['<li> <a href="' + path + element + extension + '">'
+                               + element.replace(".html", "") + '</a></li>' for element in list_]) + "</ul>"
 
 
-def generate_index_pages(db_file) -> None:
+def shard_by_prefix(words: List[str], prefix: str = '', max_size: int = 256) -> Iterator[Tuple[str, List[str]]]:
     """
-    These pages are the index pages for the word/ and
-        folio/ directories.
+    Split the words into shards by their prefixes, a word
+        belongs to the shard with the longest prefix of it.
+
+    :param words: Sorted words that start with the prefix.
+    :param prefix: Common prefix of the words.
+    :param max_size: Maximum number of words in a shard.
+    :return: A generator of prefix, words of the shard pairs.
+    """
+    if len(words) <= max_size:
+        yield prefix, words
+        return
+    rest = [word for word in words if len(word) == len(prefix)]
+    groups = [(char, list(group)) for char, group in groupby(words[len(rest):], key=itemgetter(len(prefix)))]
+    for char, group in sorted(groups, key=lambda pair: len(pair[1])):  # Small groups stay with the prefix.
+        if len(rest) + len(group) <= max_size:
+            rest.extend(group)
+        else:
+            yield from shard_by_prefix(group, prefix + char, max_size)
+    if rest:
+        yield prefix, sorted(rest)
+
+
+def shard_name(key: str) -> str:
+    """
+    Get the file name of a search shard, keys are hex encoded
+        as words contain characters that do not belong in URLs.
+
+    :param key: Prefix or n-gram of the shard.
+    :return: The file name of the shard.
+    """
+    return '_' + key.encode().hex() + '.json'
+
+
+def write_if_changed(path: str, contents: str, manifest: Dict[str, str]) -> str:
+    """
+    Write a generated file unless it is the same as in the previous build.
+
+    :param path: Path of the file.
+    :param contents: Contents of the file.
+    :param manifest: Page path -> input hash pairs of the previous build.
+    :return: Hash of the contents.
+    """
+    contents_hash = hash_inputs(contents)
+    if not is_up_to_date(path, contents_hash, manifest):
+        with open(path, 'w') as file:
+            file.write(contents)
+            count_written(file)
+    return contents_hash
+
+
+def generate_search_index(db_file: str, manifest: Optional[Dict[str, str]] = None,
+                          transcriber: Optional[str] = None) -> Dict[str, str]:
+    """
+    Generate the search index under search/, words are sharded by their
+        prefixes into search/words/ with the folios they appear in and
+        their number of appearances, and the bigrams and trigrams of
+        the words point to the words in search/grams/ for substring queries.
+        search/index.json lists the prefixes of the shards.
 
     :param db_file: Database file, of type SQLite3
+    :param manifest: Page path -> input hash pairs of the previous build.
+    :param transcriber: Transcriber whose words are indexed, the first one if not given.
+    :return: Page path -> input hash pairs of the generated files.
+    """
+    manifest = manifest or {}
+    with connect(db_file) as db:
+        rows = db.execute("SELECT wordName, folioName, occurrenceCount FROM Word CROSS JOIN Appears USING (wordID) "
+                          "JOIN Folio USING (folioID) WHERE transcriberID = ? AND wordName != '' "
+                          "ORDER BY wordName, folioID", (get_transcriber_id(db.cursor(), transcriber),))
+        postings = {word: [[row[1], row[2]] for row in group] for word, group in groupby(rows, key=itemgetter(0))}
+    for path in ['search/words/', 'search/grams/']:
+        Path(path).mkdir(parents=True, exist_ok=True)
+    hashes = {}
+    prefixes = []
+    for prefix, shard in shard_by_prefix(list(postings)):
+        prefixes.append(prefix)
+        path = 'search/words/' + shard_name(prefix)
+        hashes[path] = write_if_changed(path, dumps({word: postings[word] for word in shard},
+                                                    separators=(',', ':')), manifest)
+    grams: Dict[str, List[str]] = {}
+    for word in postings:
+        for n in (2, 3):
+            for gram in {word[i:i + n] for i in range(len(word) - n + 1)}:
+                grams.setdefault(gram, []).append(word)
+    for gram, gram_words in grams.items():
+        path = 'search/grams/' + shard_name(gram)
+        hashes[path] = write_if_changed(path, dumps(gram_words, separators=(',', ':')), manifest)
+    hashes['search/index.json'] = write_if_changed('search/index.json', dumps({"prefixes": sorted(prefixes)}),
+                                                   manifest)
+    return hashes
+
+
+explanation_statistics = """<div class="section title">
+                    <h1>Statistics</h1>
+                </div>
+                <div class="section general"><h2><small>Measures of the Text</small></h2>
+                    <p>How often the words occur against their rank, how long they are, and how predictable
+                    their characters are, for the whole transcription, for each of its sections, and for the
+                    two languages Currier found in it, computed by corpus_stats.py.
+                    </p>
+            </div>
+"""
+chart_width, chart_height, chart_margin = 480, 240, 40
+longest_charted_word = 20  # Longer words are too rare to show on the word length chart.
+
+
+def svg_chart(contents: str, x_label: str, y_label: str) -> str:
     """
-    with sql.connect(db_file) as db:
-        cur = db.cursor()
-        cur.execute('SELECT folioName FROM Folio ORDER BY folioID')
-        folio_list = cur.fetchall()
-    folio_list = [folio[0] + '.html' for folio in folio_list]
-    words_list = listdir("word/")
-    words_list = get_list(words_list)
-    with open("templates/general_index.html") as template_file:
-        template = template_file.read()
-    template = set_template_commons(template)
-    word_page = replace_templates(
-        {
+    Wrap the marks of a chart into an inline SVG with its axes.
+
+    :param contents: Marks of the chart, drawn within the margins.
+    :param x_label: Label of the horizontal axis.
+    :param y_label: Label of the vertical axis.
+    :return: The SVG element.
+    """
+    bottom, right = chart_height - chart_margin, chart_width - chart_margin
+    return (f'<svg viewBox="0 0 {chart_width} {chart_height}" width="100%" role="img">'
+            f'<path d="M{chart_margin},{chart_margin}V{bottom}H{right}" fill="none" stroke="currentColor"/>'
+            f'{contents}<text x="{chart_width / 2}" y="{chart_height - 8}" text-anchor="middle">{x_label}</text>'
+            f'<text x="12" y="{chart_height / 2}" transform="rotate(-90 12 {chart_height / 2})" '
+            f'text-anchor="middle">{y_label}</text></svg>')
+
+
+def svg_log_line(points: List[Tuple[int, int]], x_label: str, y_label: str) -> str:
+    """
+    Draw points on logarithmic axes, joined by a line.
+
+    :param points: Positive x, y pairs, in order of x.
+    :param x_label: Label of the horizontal axis.
+    :param y_label: Label of the vertical axis.
+    :return: The SVG element.
+    """
+    if not points:
+        return ""
+    x_max, y_max = log10(max(x for x, _ in points)) or 1, log10(max(y for _, y in points)) or 1
+    span_x, span_y = chart_width - 2 * chart_margin, chart_height - 2 * chart_margin
+    coordinates = ' '.join(f'{chart_margin + log10(x) / x_max * span_x:.1f},'
+                           f'{chart_height - chart_margin - log10(y) / y_max * span_y:.1f}' for x, y in points)
+    return svg_chart(f'<polyline points="{coordinates}" fill="none" stroke="currentColor" stroke-width="2"/>',
+                     x_label, y_label)
+
+
+def svg_bars(values: List[int], x_label: str, y_label: str) -> str:
+    """
+    Draw a bar for each value, labelled with its index.
+
+    :param values: Heights of the bars.
+    :param x_label: Label of the horizontal axis.
+    :param y_label: Label of the vertical axis.
+    :return: The SVG element.
+    """
+    if not values:
+        return ""
+    width = (chart_width - 2 * chart_margin) / len(values)
+    span_y = chart_height - 2 * chart_margin
+    bars = []
+    for i, value in enumerate(values):
+        height = value / (max(values) or 1) * span_y
+        x = chart_margin + i * width
+        bars.append(f'<rect x="{x + 1:.1f}" y="{chart_height - chart_margin - height:.1f}" width="{width - 2:.1f}" '
+                    f'height="{height:.1f}"><title>{i}: {value}</title></rect>'
+                    f'<text x="{x + width / 2:.1f}" y="{chart_height - chart_margin + 14}" text-anchor="middle" '
+                    f'font-size="10">{i}</text>')
+    return svg_chart(''.join(bars), x_label, y_label)
+
+
+def statistics_table(groups: Dict[str, dict], heading: str) -> str:
+    """
+    Generate a table comparing the measures of groups of tokens,
+        such as the transcribers or the sections.
+
+    :param groups: Group name -> measure -> value pairs, as corpus_stats.py saves them.
+    :param heading: Heading of the column of the group names.
+    :return: The HTML table.
+    """
+    rows = ''.join(
+        f'<tr><td>{name}</td><td>{group["tokens"]}</td><td>{group["words"]}</td>'
+        f'<td>{group["type_token_ratio"]:.3f}</td><td>{group["mean_length"]:.2f}</td>'
+        f'<td>{group["character_entropy"]:.3f}</td><td>{group["conditional_entropy"]:.3f}</td><td>'
+        + ' '.join(word_link(word, '../word/') for word, _ in group["top_words"][:5])
+        + '</td></tr>' for name, group in groups.items())
+    return (f'<table><thead><tr><th>{heading}</th><th>Tokens</th><th>Words</th><th>Words per token</th>'
+            f'<th>Mean length</th><th>Character entropy</th><th>Conditional entropy</th><th>Most frequent</th>'
+            f'</tr></thead><tbody>{rows}</tbody></table>')
+
+
+def statistics_page_values(statistics: Dict[str, dict], transcriber: str) -> Dict[str, str]:
+    """
+    Get the values of the placeholders of the statistics page.
+
+    :param statistics: Transcriber name -> statistics pairs, as corpus_stats.py saves them.
+    :param transcriber: Name of the transcriber whose statistics are shown in detail.
+    :return: Placeholder -> value pairs.
+    """
+    shown = statistics[transcriber]
+    sections = [
+        ('Transcribers', statistics_table(statistics, 'Transcriber')),
+        (f'Rank and Frequency <small>Zipf exponent {shown["zipf_exponent"]:.3f}</small>',
+         svg_log_line(shown["zipf"], 'Rank', 'Frequency')),
+        ('Word Lengths', svg_bars(shown["word_lengths"][:longest_charted_word + 1], 'Characters', 'Tokens')),
+        ('Sections', statistics_table(shown["sections"], 'Section')),
+        ('Currier Languages', statistics_table(shown["languages"], 'Language'))
+    ]
+    return {
+        "page-title": "Statistic",
+        "list_section": ''.join(f'<div class="section statistics"><h4>{heading}</h4>{contents}</div>'
+                                for heading, contents in sections if contents),
+        "explanation": explanation_statistics
+    }
+
+
+def generate_statistics_page(db_file: str, manifest: Optional[Dict[str, str]] = None,
+                             transcriber: Optional[str] = None) -> Dict[str, str]:
+    """
+    Generate stats/index.html from the statistics corpus_stats.py saved,
+        the page is not generated if there are none. parser.py deletes
+        the statistics of the transcribers it loads, so the ones left
+        are of their current transcriptions.
+
+    :param db_file: Database file, of type SQLite3
+    :param manifest: Page path -> input hash pairs of the previous build.
+    :param transcriber: Transcriber whose statistics are shown in detail, the first one if not given.
+    :return: Page path -> input hash pairs of the generated page.
+    """
+    with connect(db_file) as db:
+        cursor = db.cursor()
+        transcriber_id = get_transcriber_id(cursor, transcriber)
+        rows = cursor.execute("SELECT transcriberID, transcriberName, statistics FROM Statistics "
+                              "JOIN Transcriber USING (transcriberID) ORDER BY transcriberID").fetchall()
+    statistics = {name: loads(row_statistics) for _, name, row_statistics in rows}
+    shown = next((name for row_id, name, _ in rows if row_id == transcriber_id), None)
+    if shown is None:
+        return {}
+    template = load_template("templates/general_index.html", ["page-title", "list_section", "explanation"])
+    Path('stats/').mkdir(exist_ok=True)
+    path = 'stats/index.html'
+    return {path: write_if_changed(path, template.render(statistics_page_values(statistics, shown)), manifest or {})}
+
+
+def index_page_name(shard: List[Tuple[str, int]]) -> str:
+    """
+    Get the file name of a page of the word index, named by its first word.
+
+    :param shard: Word, occurrence count pairs of the page.
+    :return: The file name.
+    """
+    return 'index_' + shard[0][0].encode().hex() + '.html'
+
+
+def index_navigation(shards: List[List[Tuple[str, int]]], current: Optional[int] = None) -> str:
+    """
+    Generate the links between the pages of the word index.
+
+    :param shards: Word, occurrence count pairs of each page, in order.
+    :param current: Index of the page the links are on, None for word/index.html.
+    :return: The string to put into the HTML.
+    """
+    links = []
+    for i, shard in enumerate(shards):
+        label = f'{escape(shard[0][0])} &ndash; {escape(shard[-1][0])}'
+        links.append(f'<b>{label}</b>' if i == current else f'<a href="{index_page_name(shard)}">{label}</a>')
+    steps = ''
+    if current is not None:
+        before = '<a href="index.html">Index</a>' if current == 0 else \
+            f'<a href="{index_page_name(shards[current - 1])}">&lt;</a>'
+        after = '' if current == len(shards) - 1 else f'<a href="{index_page_name(shards[current + 1])}">&gt;</a>'
+        steps = f'<p>{before} {after}</p>'
+    return f'<nav class="word-index">{steps}<p>{" | ".join(links)}</p></nav>'
+
+
+def folio_thumbnail_list(folio_names: List[str]) -> str:
+    """
+    Generate the list of the folios, with the thumbnails media_build.py
+        built, which the browser loads only as they are scrolled into view.
+
+    :param folio_names: Names of the folios, in order.
+    :return: The string to put into the HTML.
+    """
+    items = []
+    for folio_name in folio_names:
+        thumbnail = ''
+        image_name = resolve_image(folio_name)
+        derivatives = image_name and load_derivatives(image_name)
+        if derivatives and derivatives.get("thumbnail"):
+            source = '../media/derived/' + quote(splitext(image_name)[0]) + '/' + derivatives["thumbnail"]
+            thumbnail = f'<img src="{source}" loading="lazy" decoding="async" alt="{folio_name}"/> '
+        items.append(f'<li> <a href="{folio_name}.html">{thumbnail}{folio_name}</a></li>')
+    return '<ul class="folio-thumbnails">' + '\n'.join(items) + '</ul>'
+
+
+def index_page_values(folio_names: List[str], words: List[Tuple[str, int]]) -> Dict[str, Dict[str, str]]:
+    """
+    Get the values of the placeholders of the index pages, the words are
+        split by their prefixes into pages of a few hundred words, which
+        word/index.html links to, rather than listed on a single page.
+
+    :param folio_names: Names of the folios, in order.
+    :param words: Word, occurrence count pairs of the words that have pages, sorted.
+    :return: Path of the index page -> placeholder -> value pairs.
+    """
+    counts = dict(words)
+    shards = sorted(([(word, counts[word]) for word in shard]
+                     for _, shard in shard_by_prefix([word for word, _ in words]) if shard))
+    pages = {
+        "word/index.html": {
             "page-title": "Word",
-            "list_section": words_list,
+            "list_section": search_box + index_navigation(shards),
             "explanation": explanation_word
-        }, template)
-    with open("word/index.html", "w") as word_index:
-        word_index.write(word_page)
-    folio_list = get_list(folio_list)
-    folio_page = replace_templates(
-        {
+        },
+        "folio/index.html": {
             "page-title": "Folio",
-            "list_section": folio_list,
+            "list_section": folio_thumbnail_list(folio_names),
             "explanation": explanation_folio
-        }, template)
-    with open("folio/index.html", "w") as folio_index:
-        folio_index.write(folio_page)
+        }
+    }
+    for i, shard in enumerate(shards):
+        word_list = '<ul>' + '\n'.join(f'<li> {word_link(word)} <small>{count}</small></li>'
+                                        for word, count in shard) + '</ul>'
+        pages["word/" + index_page_name(shard)] = {
+            "page-title": "Word",
+            "list_section": search_box + index_navigation(shards, i) + word_list,
+            "explanation": explanation_word
+        }
+    return pages
+
+
+def read_index(cursor: sql.Cursor, transcriber_id: int) -> Tuple[List[str], List[Tuple[str, int]]]:
+    """
+    Read what the index pages list from the database.
+
+    :param cursor: Cursor to the database.
+    :param transcriber_id: ID of the transcriber whose words are listed.
+    :return: Names of the folios in order, and word, occurrence count pairs sorted by word.
+    """
+    folio_names = [row[0] for row in cursor.execute("SELECT folioName FROM Folio ORDER BY folioID")]
+    words = cursor.execute("SELECT wordName, sum(occurrenceCount) FROM Word CROSS JOIN Appears USING (wordID) "
+                           "WHERE transcriberID = ? AND wordName != '' GROUP BY wordName ORDER BY wordName",
+                           (transcriber_id,)).fetchall()
+    return folio_names, words
+
+
+def generate_index_pages(db_file: str, manifest: Optional[Dict[str, str]] = None,
+                         transcriber: Optional[str] = None) -> Dict[str, str]:
+    """
+    These pages are the index pages for the word/ and
+        folio/ directories.
+
+    :param db_file: Database file, of type SQLite3
+    :param manifest: Page path -> input hash pairs of the previous build.
+    :param transcriber: Transcriber whose words are listed, the first one if not given.
+    :return: Page path -> input hash pairs of the generated pages.
+    """
+    with connect(db_file) as db:
+        cursor = db.cursor()
+        folio_names, words = read_index(cursor, get_transcriber_id(cursor, transcriber))
+    template = load_template("templates/general_index.html", ["page-title", "list_section", "explanation"])
+    return {path: write_if_changed(path, template.render(values), manifest or {})
+            for path, values in index_page_values(folio_names, words).items()}
 
 
 if __name__ == '__main__':
@@ -240,10 +1001,70 @@ if __name__ == '__main__':
     program = ArgumentParser(description="Generate a Static Webpage for Exploring the Voynich Manuscript.")
     program.add_argument("input", help="Voynich data in a SQLite3 file")
     program.add_argument("--generate_folder", "-f", action="store_true", help="Generate the necessary folders.")
+    program.add_argument("--jobs", "-j", type=int, default=1, help="Number of processes to generate pages with.")
+    program.add_argument("--transcriber", "-t",
+                         help="Transcriber whose transcription is shown, the first one loaded if not given.")
+    program.add_argument("--force", action="store_true",
+                         help="Generate every page, even if its inputs did not change since the last build.")
+    program.add_argument("--metrics", "-m",
+                         help="Save the timings, page counts and queries of each stage to this file.")
+    program.add_argument("--profile", nargs='?', const='vsig.prof',
+                         help="Profile each stage, and save the profile of the slowest one to this file.")
+    program.add_argument("--pack", help="Also pack the site into this file, see pack.py and pack_server.py.")
+    program.add_argument("--check", action="store_true",
+                         help="Check the links and the images of the site after generating it, see check_site.py.")
     args = program.parse_args()
+    if args.metrics or args.profile:
+        start_recording(args.profile is not None)
     if args.generate_folder:
         for path in ['folio/', 'word/']:
             Path(path).mkdir(exist_ok=True)
-    generate_folio_pages(args.input)
-    generate_word_pages(args.input)
-    generate_index_pages(args.input)
+    build_manifest = load_manifest()
+    old_pages = build_manifest.get('pages', {})
+    previous = {} if args.force else old_pages
+    pages = {}
+    for name, generate in [('folio_pages', generate_folio_pages), ('word_pages', generate_word_pages)]:
+        with stage(name):
+            generated = generate(args.input, args.jobs, previous, args.transcriber)
+            count('pages', len(generated))
+        pages.update(generated)
+    with stage('search_index'):
+        generated = generate_search_index(args.input, previous, args.transcriber)
+        count('pages', len(generated))
+    pages.update(generated)
+    with stage('statistics_page'):
+        try:
+            from corpus_stats import update_statistics  # NumPy is needed only for the statistics.
+        except ImportError as error:
+            warn(f"The statistics were not brought up to date, run corpus_stats.py once {error.name} is installed.")
+        else:
+            count('statistics_computed', len(update_statistics(args.input)))  # Those of the reloaded transcribers.
+        generated = generate_statistics_page(args.input, previous, args.transcriber)
+        count('pages', len(generated))
+    pages.update(generated)
+    with stage('index_pages'):
+        generated = generate_index_pages(args.input, previous, args.transcriber)
+        count('pages', len(generated))
+    pages.update(generated)
+    with stage('remove_orphans'):
+        remove_orphans(old_pages, pages)
+    build_manifest['pages'] = pages
+    save_manifest(build_manifest)
+    report = None
+    if args.check:
+        with stage('check'):
+            report = check_site(args.jobs)
+        print_report(report)
+    if args.pack:
+        with stage('pack'):
+            packed, compressed = pack_site(args.pack)
+            count('packed_files', packed)
+            count('compressed_files', compressed)
+    if args.metrics or args.profile:
+        print_metrics()
+    if args.metrics:
+        save_metrics(args.metrics)
+    if args.profile:
+        dump_profile(args.profile)
+    if report is not None and any(report):
+        exit(1)  # As check_site.py does, so that a deploy stops on a broken site.
@@ -0,0 +1,104 @@
+-- Folios, words and transcribers are referred to by their integer IDs,
+-- the lines and appearances of each transcriber are kept side by side.
+-- inputHash identifies the transcription each transcriber was last loaded from.
+CREATE TABLE IF NOT EXISTS Transcriber(
+    transcriberID INTEGER PRIMARY KEY,
+    transcriberName TEXT UNIQUE NOT NULL,
+    inputHash TEXT
+);
+
+-- language is the Currier language of the page header, such as A or B.
+CREATE TABLE IF NOT EXISTS Folio(
+    folioID INTEGER PRIMARY KEY,
+    folioName TEXT UNIQUE NOT NULL,
+    language TEXT
+);
+
+CREATE TABLE IF NOT EXISTS Word(
+    wordID INTEGER PRIMARY KEY,
+    wordName TEXT UNIQUE NOT NULL
+);
+
+-- One row per line of a transcriber, in the order of the transcription.
+CREATE TABLE IF NOT EXISTS Paragraph(
+    paragraphID INTEGER PRIMARY KEY,
+    transcriberID INTEGER NOT NULL REFERENCES Transcriber(transcriberID),
+    folioID INTEGER NOT NULL REFERENCES Folio(folioID),
+    locus TEXT NOT NULL,
+    paragraph TEXT
+);
+
+-- One row per word per folio per transcriber, lineNumber and
+-- tokenOffset mark the first appearance of the word in the folio,
+-- positions holds the line number and token offset of every appearance
+-- as pairs of little-endian 32-bit integers, see parser.unpack_positions.
+CREATE TABLE IF NOT EXISTS Appears(
+    transcriberID INTEGER NOT NULL REFERENCES Transcriber(transcriberID),
+    wordID INTEGER NOT NULL REFERENCES Word(wordID),
+    folioID INTEGER NOT NULL REFERENCES Folio(folioID),
+    occurrenceCount INTEGER NOT NULL DEFAULT 1,
+    lineNumber INTEGER,
+    tokenOffset INTEGER,
+    positions BLOB NOT NULL,
+    PRIMARY KEY (transcriberID, wordID, folioID)
+) WITHOUT ROWID;
+
+-- The most similar folios and paragraphs of each, filled by similarity.py.
+CREATE TABLE IF NOT EXISTS Similar(
+    transcriberID INTEGER NOT NULL REFERENCES Transcriber(transcriberID),
+    folioID INTEGER NOT NULL REFERENCES Folio(folioID),
+    rank INTEGER NOT NULL,
+    similarID INTEGER NOT NULL REFERENCES Folio(folioID),
+    score REAL NOT NULL,
+    PRIMARY KEY (transcriberID, folioID, rank)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS SimilarParagraph(
+    paragraphID INTEGER NOT NULL REFERENCES Paragraph(paragraphID),
+    rank INTEGER NOT NULL,
+    similarID INTEGER NOT NULL REFERENCES Paragraph(paragraphID),
+    score REAL NOT NULL,
+    PRIMARY KEY (paragraphID, rank)
+) WITHOUT ROWID;
+
+-- Alternate forms of each word within a small edit distance, filled by variants.py.
+CREATE TABLE IF NOT EXISTS Variant(
+    wordID INTEGER NOT NULL REFERENCES Word(wordID),
+    variantID INTEGER NOT NULL REFERENCES Word(wordID),
+    distance INTEGER NOT NULL,
+    PRIMARY KEY (wordID, variantID)
+) WITHOUT ROWID;
+
+-- Statistics of the words of each transcriber as JSON, filled by corpus_stats.py,
+-- inputHash is the one they were computed from.
+CREATE TABLE IF NOT EXISTS Statistics(
+    transcriberID INTEGER PRIMARY KEY REFERENCES Transcriber(transcriberID),
+    inputHash TEXT NOT NULL,
+    statistics TEXT NOT NULL
+);
+
+-- Trigram index of the lines for substring searches, such as
+-- SELECT paragraph FROM ParagraphText WHERE ParagraphText MATCH '"ckh"' AND paragraph GLOB '*ckh*dy*'
+-- it is rebuilt by parser.py after each load.
+CREATE VIRTUAL TABLE IF NOT EXISTS ParagraphText USING fts5(
+    paragraph,
+    content='Paragraph',
+    content_rowid='paragraphID',
+    tokenize='trigram case_sensitive 1'
+);
+
+CREATE INDEX IF NOT EXISTS ParagraphByFolio ON Paragraph(transcriberID, folioID);
+CREATE INDEX IF NOT EXISTS ParagraphByLocus ON Paragraph(folioID, locus);
+
+-- Lines that two transcribers read differently, such as
+-- SELECT * FROM Disagreement WHERE transcriber = 'H' AND otherTranscriber = 'C'
+CREATE VIEW IF NOT EXISTS Disagreement AS
+SELECT folioName, line.locus AS locus,
+       transcriber.transcriberName AS transcriber, line.paragraph AS text,
+       other.transcriberName AS otherTranscriber, otherLine.paragraph AS otherText
+FROM Paragraph AS line
+JOIN Paragraph AS otherLine ON otherLine.folioID = line.folioID AND otherLine.locus = line.locus
+    AND otherLine.transcriberID != line.transcriberID AND otherLine.paragraph != line.paragraph
+JOIN Folio ON Folio.folioID = line.folioID
+JOIN Transcriber AS transcriber ON transcriber.transcriberID = line.transcriberID
+JOIN Transcriber AS other ON other.transcriberID = otherLine.transcriberID;